@@ -1,6 +1,9 @@
+import sys
+from contextlib import contextmanager
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.widgets import Slider, RangeSlider, TextBox, Button
+from campsite_scenario import ResultCache, cached_run, load_scenario, merge_scenario
 
 
 def normal_dist(x , mean , sd, scale=None):
@@ -16,8 +19,103 @@ def norm_dict(d):
     return {key: value / sum(d.values()) for key, value in d.items()}
 
 
+class BlitRenderer(object):
+    """Redraws single axes of a figure via blitting instead of the whole figure.
+    Axis limits only change if data leaves the view or fills less than half of it,
+    only then the whole figure is redrawn (ticks change)."""
+    def __init__(self, fig):
+        self.canvas = fig.canvas
+        self.artists = {} # axes -> artists changing on update
+        self.backgrounds = {} # axes -> saved image of axes without its artists
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def add(self, ax, *artists):
+        # artists are excluded from normal drawing and drawn on top of background
+        for artist in artists:
+            artist.set_animated(True)
+        self.artists.setdefault(ax, []).extend(artists)
+
+    def on_draw(self, event):
+        # after every full redraw: save backgrounds and draw artists on top
+        for ax, artists in self.artists.items():
+            self.backgrounds[ax] = self.canvas.copy_from_bbox(ax.bbox)
+            for artist in artists:
+                ax.draw_artist(artist)
+
+    def keep_limits(self, ax, xlim, ylim):
+        data = ax.dataLim
+        for (low, high), (data_low, data_high) in ((xlim, data.intervalx), (ylim, data.intervaly)):
+            if data_low < low or data_high > high or data_high - data_low < 0.5 * (high - low):
+                return False
+        return True
+
+    def blit(self, ax):
+        # redraw only artists of ax on top of saved background, False if not possible yet
+        if ax not in self.backgrounds or not self.canvas.supports_blit:
+            return False
+        self.canvas.restore_region(self.backgrounds[ax])
+        for artist in self.artists[ax]:
+            ax.draw_artist(artist)
+        self.canvas.blit(ax.bbox)
+        return True
+
+    def update(self, ax):
+        xlim, ylim = ax.get_xlim(), ax.get_ylim()
+        ax.relim()
+        if not (self.keep_limits(ax, xlim, ylim) and self.blit(ax)):
+            ax.autoscale_view()
+            self.canvas.draw_idle()
+
+
+class BlitTextBox(TextBox):
+    """TextBox redrawing only itself via blitting, TextBox redraws the whole figure
+    on every key press, cursor movement and hover"""
+    def __init__(self, renderer, ax, label, **kwargs):
+        super().__init__(ax, label, **kwargs)
+        self.renderer = renderer
+        # patch is drawn again for changing hover color, it covers the inner half of the spines
+        renderer.add(ax, ax.patch, *ax.spines.values(), self.text_disp, self.cursor)
+
+    def redraw(self):
+        if not self.renderer.blit(self.ax):
+            self.ax.figure.canvas.draw_idle()
+
+    @contextmanager
+    def blitting(self):
+        # TextBox calls canvas.draw() directly, redirect it while no callbacks are running
+        canvas = self.ax.figure.canvas
+        canvas.draw = self.redraw
+        try:
+            yield
+        finally:
+            del canvas.draw
+
+    def _rendercursor(self):
+        # figure has to be drawn once to measure text
+        if self.ax.figure._get_renderer() is None:
+            self.ax.figure.canvas.draw()
+        with self.blitting():
+            super()._rendercursor()
+
+    def _motion(self, event):
+        with self.blitting():
+            super()._motion(event)
+
+    def stop_typing(self):
+        # same as TextBox.stop_typing, but submit callbacks may redraw the whole figure
+        notifysubmit = self.capturekeystrokes
+        if self.capturekeystrokes:
+            self._on_stop_typing()
+            self._on_stop_typing = None
+        self.capturekeystrokes = False
+        self.cursor.set_visible(False)
+        self.redraw()
+        if notifysubmit and self.eventson:
+            self._observers.process('submit', self.text)
+
+
 class MonteCarloSim(object):
-    def __init__(self):
+    def __init__(self, gui=True, scenario=None):
         # Parameter fuer Simulation
         # Normalverteilung neue Camper-Gruppen pro Tag
         self.dist_day_mean = 13
@@ -40,10 +138,18 @@ class MonteCarloSim(object):
         self.N = 1000 # number of iterations for Monte-Carlo per intervall
         # granularity of time intervalls, smaller values are faster but less accurate
         self.days_per_year = 12 * 30 # divide year into 12 months with 30 days each
+        self.days_x = np.arange(self.days_per_year) * 12 / self.days_per_year # x axis in months at begin of each day, same as discrete simulation
         # enable or disable specific dynamic input widgets, faster if disabled
         self.input_enable = {'seed': True, 'dist_day': True, 'dist_year': True, 'share_types': True, 'price_types': True, 'costs': True}
         self.seed = None
+        self.show_progress = gui # print progress of calculation
         self.rng = np.random.default_rng(self.seed)
+        # results of already calculated scenarios with seed, None disables the cache
+        self.cache = ResultCache() if gui else None
+
+        # overwrite parameters above by values of scenario, e.g. loaded from file
+        if scenario is not None:
+            self.set_scenario(scenario)
 
         # Ergebnisse nach Tagen/Zeitintervallen
         self.result_groups = np.zeros(self.days_per_year) # Mittelwert Anzahl Gäste
@@ -53,71 +159,90 @@ class MonteCarloSim(object):
         self.result_costs_customers = np.zeros(self.days_per_year) # Selbstkosten abhängig von Personenzahl
         self.result_costs_daily = np.zeros(self.days_per_year) # Gemeinkosten
         self.result_balance = np.zeros(self.days_per_year) # Bilanz
+        # Verteilung der Ergebnisse je Tag über alle self.N Experimente als Quantile
+        self.quantiles = (0.05, 0.5, 0.95) # P5, P50, P95 für Bänder in den Ergebnissen
+        self.result_groups_quantiles = np.zeros((len(self.quantiles), self.days_per_year))
+        self.result_balance_quantiles = np.zeros((len(self.quantiles), self.days_per_year))
+        # Quantile der Monats- und Jahresbilanz der einzelnen Experimente, z.B. Risiko eines schlechten Juli
+        self.result_balance_month_quantiles = np.zeros((len(self.quantiles), 12))
+        self.result_balance_year_quantiles = np.zeros(len(self.quantiles))
+        # Summen je Experiment und Monat als Stichproben, z.B. für statistische Tests
+        self.month_samples = {}
 
         # normalize distributions
         self.dist_nights_norm = norm_list(self.dist_nights)
         self.dist_people_norm = norm_list(self.dist_people)
         self.share_types_norm = norm_dict(self.share_types)
+        self.calc_dist_year()
+
+        # without gui only the calculation via simulate() is available, e.g. for batch runs
+        if not gui:
+            return
 
         self.fig = plt.figure(constrained_layout=True, figsize=(16,9))
         self.fig.suptitle('Monte-Carlo-Simulation Campingplatz', weight='bold')
         self.fig_gs = self.fig.add_gridspec(4,4)
+        # redraws only changed distribution plots on input
+        self.renderer = BlitRenderer(self.fig)
 
         b_calc = Button(plt.axes([0.08, 0.96, 0.1, 0.03]), 'Berechnung starten')
         b_calc.on_clicked(self.calculate)
 
         if self.input_enable['seed']:
-            tb_seed = TextBox(plt.axes([0.14,0.92, 0.05, 0.03]), 'Seed Zufallszahlengenerator ', initial='' if self.seed is None else str(self.seed))
+            tb_seed = BlitTextBox(self.renderer, plt.axes([0.14,0.92, 0.05, 0.03]), 'Seed Zufallszahlengenerator ', initial='' if self.seed is None else str(self.seed))
             tb_seed.on_submit(self.set_seed)
 
         if self.input_enable['dist_day']:
-            tb_dist_day_mean = TextBox(plt.axes([0.14,0.88, 0.05, 0.03]), 'Mittelwert Tagesverteilung ', initial=str(self.dist_day_mean))
+            tb_dist_day_mean = BlitTextBox(self.renderer, plt.axes([0.14,0.88, 0.05, 0.03]), 'Mittelwert Tagesverteilung ', initial=str(self.dist_day_mean))
             tb_dist_day_mean.on_submit(self.set_dist_day_mean)
-            tb_dist_day_sd = TextBox(plt.axes([0.14,0.85, 0.05, 0.03]), 'Std.-Abw. Tagesverteilung ', initial=str(self.dist_day_sd))
+            tb_dist_day_sd = BlitTextBox(self.renderer, plt.axes([0.14,0.85, 0.05, 0.03]), 'Std.-Abw. Tagesverteilung ', initial=str(self.dist_day_sd))
             tb_dist_day_sd.on_submit(self.set_dist_day_sd)
 
         if self.input_enable['dist_year']:
-            tb_dist_year_mean = TextBox(plt.axes([0.14,0.81, 0.05, 0.03]), 'Mittelwert Multiplikator Jahr ', initial=str(self.dist_year_mean))
+            tb_dist_year_mean = BlitTextBox(self.renderer, plt.axes([0.14,0.81, 0.05, 0.03]), 'Mittelwert Multiplikator Jahr ', initial=str(self.dist_year_mean))
             tb_dist_year_mean.on_submit(self.set_dist_year_mean)
-            tb_dist_year_sd = TextBox(plt.axes([0.14,0.78, 0.05, 0.03]), 'Std.-Abw. Multiplikator Jahr ', initial=str(self.dist_year_sd))
+            tb_dist_year_sd = BlitTextBox(self.renderer, plt.axes([0.14,0.78, 0.05, 0.03]), 'Std.-Abw. Multiplikator Jahr ', initial=str(self.dist_year_sd))
             tb_dist_year_sd.on_submit(self.set_dist_year_sd)
 
         if self.input_enable['share_types']:
-            tb_share_tent = TextBox(plt.axes([0.14,0.74, 0.05, 0.03]), 'Anteil Zelt ', initial=str(self.share_types['tent']))
+            tb_share_tent = BlitTextBox(self.renderer, plt.axes([0.14,0.74, 0.05, 0.03]), 'Anteil Zelt ', initial=str(self.share_types['tent']))
             tb_share_tent.on_submit(self.set_share_tent)
-            tb_share_car = TextBox(plt.axes([0.14,0.71, 0.05, 0.03]), 'Anteil Zelt + PKW ', initial=str(self.share_types['car']))
+            tb_share_car = BlitTextBox(self.renderer, plt.axes([0.14,0.71, 0.05, 0.03]), 'Anteil Zelt + PKW ', initial=str(self.share_types['car']))
             tb_share_car.on_submit(self.set_share_car)
-            tb_share_caravan = TextBox(plt.axes([0.14,0.68, 0.05, 0.03]), 'Anteil Wohnwagen/-mobil ', initial=str(self.share_types['caravan']))
+            tb_share_caravan = BlitTextBox(self.renderer, plt.axes([0.14,0.68, 0.05, 0.03]), 'Anteil Wohnwagen/-mobil ', initial=str(self.share_types['caravan']))
             tb_share_caravan.on_submit(self.set_share_caravan)
 
         if self.input_enable['price_types']:
-            tb_price_tent = TextBox(plt.axes([0.14,0.64, 0.05, 0.03]), 'Preis Zelt ', initial=str(self.price_types['tent']))
+            tb_price_tent = BlitTextBox(self.renderer, plt.axes([0.14,0.64, 0.05, 0.03]), 'Preis Zelt ', initial=str(self.price_types['tent']))
             tb_price_tent.on_submit(self.set_price_tent)
-            tb_price_car = TextBox(plt.axes([0.14,0.61, 0.05, 0.03]), 'Preis Zelt + PKW ', initial=str(self.price_types['car']))
+            tb_price_car = BlitTextBox(self.renderer, plt.axes([0.14,0.61, 0.05, 0.03]), 'Preis Zelt + PKW ', initial=str(self.price_types['car']))
             tb_price_car.on_submit(self.set_price_car)
-            tb_price_caravan = TextBox(plt.axes([0.14,0.58, 0.05, 0.03]), 'Preis Wohnwagen/-mobil ', initial=str(self.price_types['caravan']))
+            tb_price_caravan = BlitTextBox(self.renderer, plt.axes([0.14,0.58, 0.05, 0.03]), 'Preis Wohnwagen/-mobil ', initial=str(self.price_types['caravan']))
             tb_price_caravan.on_submit(self.set_price_caravan)
-            tb_price_person = TextBox(plt.axes([0.14,0.55, 0.05, 0.03]), 'Preis Person', initial=str(self.price_types['person']))
+            tb_price_person = BlitTextBox(self.renderer, plt.axes([0.14,0.55, 0.05, 0.03]), 'Preis Person', initial=str(self.price_types['person']))
             tb_price_person.on_submit(self.set_price_person)
 
         if self.input_enable['costs']:
-            tb_costs_customer = TextBox(plt.axes([0.14,0.51, 0.05, 0.03]), 'Selbstkosten pro Person/Nacht ', initial=str(self.costs_customer))
+            tb_costs_customer = BlitTextBox(self.renderer, plt.axes([0.14,0.51, 0.05, 0.03]), 'Selbstkosten pro Person/Nacht ', initial=str(self.costs_customer))
             tb_costs_customer.on_submit(self.set_costs_customer)
-            tb_costs_daily = TextBox(plt.axes([0.14,0.48, 0.05, 0.03]), 'Gemeinkosten ', initial=str(self.costs_daily))
+            tb_costs_daily = BlitTextBox(self.renderer, plt.axes([0.14,0.48, 0.05, 0.03]), 'Gemeinkosten ', initial=str(self.costs_daily))
             tb_costs_daily.on_submit(self.set_costs_daily)
 
         self.dist_day_fig = self.fig.add_subplot(self.fig_gs[0,1], title='Verteilung neue Campergruppen pro Tag', xlabel='Anzahl Gruppen')
         self.dist_day_ax, = self.dist_day_fig.plot([0],[0]) # init with empty plot
+        self.renderer.add(self.dist_day_fig, self.dist_day_ax)
         self.draw_dist_day()
 
         self.dist_year_fig = self.fig.add_subplot(self.fig_gs[1,1], title='Multiplikator Nachfrage Jahresverlauf', xlabel='Monat')
         self.dist_year_ax, = self.dist_year_fig.plot([0],[0]) # init with empty plot
+        self.renderer.add(self.dist_year_fig, self.dist_year_ax)
         self.draw_dist_year()
 
         self.share_types_fig = self.fig.add_subplot(self.fig_gs[2,0], title='Verteilung Campertypen')
         share_types_label = ('Zelt', 'Zelt+PKW', 'Wohnwagen\n/-mobil')
         x = np.arange(len(share_types_label))
         self.share_types_ax = self.share_types_fig.bar(x, range(len(x))) # init with dummy values
+        self.renderer.add(self.share_types_fig, *self.share_types_ax)
         self.share_types_fig.set_xticks(x)
         self.share_types_fig.set_xticklabels(share_types_label)
         self.draw_share_types()
@@ -126,6 +251,7 @@ class MonteCarloSim(object):
         price_types_label = ('Zelt', 'Zelt+PKW', 'Wohnwagen\n/-mobil', 'Person')
         x = np.arange(len(price_types_label))
         self.price_types_ax = self.price_types_fig.bar(x, range(len(x))) # init with dummy values
+        self.renderer.add(self.price_types_fig, *self.price_types_ax)
         self.price_types_fig.set_xticks(x)
         self.price_types_fig.set_xticklabels(price_types_label)
         self.draw_price_types()
@@ -143,6 +269,8 @@ class MonteCarloSim(object):
         # results
         self.result_groups_fig = self.fig.add_subplot(self.fig_gs[0,2:4], title='Ergebnis: Gruppen pro Tag', xlabel='Monat')
         self.result_groups_ax, = self.result_groups_fig.plot([0],[0]) # init with empty plot
+        self.result_groups_median_ax, = self.result_groups_fig.plot([0],[0], linestyle='--', color='C0', linewidth=0.8)
+        self.result_groups_band = None # P5-P95 band, created after calculation
 
         self.result_balance_fig = self.fig.add_subplot(self.fig_gs[1:3,2:4], title='Ergebnis: Bilanz pro Tag', xlabel='Monat')
         self.result_income_ax, = self.result_balance_fig.plot([0],[0], label='Gesamteinnahmen')
@@ -151,29 +279,32 @@ class MonteCarloSim(object):
         self.result_costs_customers_ax, = self.result_balance_fig.plot([0],[0], label='Selbstkosten')
         self.result_costs_daily_ax, = self.result_balance_fig.plot([0],[0], label='Gemeinkosten')
         self.result_balance_ax, = self.result_balance_fig.plot([0],[0], label='Bilanz')
+        self.result_balance_median_ax, = self.result_balance_fig.plot([0],[0], linestyle='--', color=self.result_balance_ax.get_color(), linewidth=0.8, label='Bilanz Median')
+        self.result_balance_band = None # P5-P95 band, created after calculation
         self.result_balance_fig.legend()
 
         self.table_balance_fig = self.fig.add_subplot(self.fig_gs[3,2], frameon=False)
         self.table_balance_fig.set_axis_off()
-        balance_label = ('Mittelwert', 'Standardabweichung', 'Maximum', 'Summe')
-        self.table_balance_ax = self.table_balance_fig.table(cellText=[' ']*4, rowLabels=balance_label, colLabels=('Bilanz',), cellLoc='left', loc='center')
+        balance_label = ('Mittelwert', 'Standardabweichung', 'Maximum', 'Summe', '5%-Quantil Jahr', '5%-Quantil Hauptsaison')
+        self.table_balance_ax = self.table_balance_fig.table(cellText=[' ']*6, rowLabels=balance_label, colLabels=('Bilanz',), cellLoc='left', loc='center')
 
         self.table_customers_fig = self.fig.add_subplot(self.fig_gs[3,3], frameon=False)
         self.table_customers_fig.set_axis_off()
-        customers_label = ('Mittelwert', 'Standardabweichung', 'Maximum')
-        self.table_customers_ax = self.table_customers_fig.table(cellText=[' ']*3, rowLabels=customers_label, colLabels=('Gruppen',), cellLoc='left', loc='center')
+        customers_label = ('Mittelwert', 'Standardabweichung', 'Maximum', 'max. 95%-Quantil Tag')
+        self.table_customers_ax = self.table_customers_fig.table(cellText=[' ']*4, rowLabels=customers_label, colLabels=('Gruppen',), cellLoc='left', loc='center')
 
         plt.show()
 
+    def calc_dist_year(self):
+        # multiplicator for each day of year
+        self.dist_year = normal_dist(self.days_x, self.dist_year_mean, self.dist_year_sd, 1)
+        return self.days_x
+
     def draw_dist_year(self):
-        x = np.linspace(0,12, self.days_per_year)
-        y = normal_dist(x, self.dist_year_mean, self.dist_year_sd, 1)
-        self.dist_year = y
+        x = self.calc_dist_year()
         self.dist_year_ax.set_xdata(x)
-        self.dist_year_ax.set_ydata(y)
-        self.dist_year_fig.relim()
-        self.dist_year_fig.autoscale_view()
-        plt.draw()
+        self.dist_year_ax.set_ydata(self.dist_year)
+        self.renderer.update(self.dist_year_fig)
 
     def set_dist_year_mean(self, mean):
         self.dist_year_mean = float(mean)
@@ -188,9 +319,7 @@ class MonteCarloSim(object):
         y = normal_dist(x, self.dist_day_mean, self.dist_day_sd)
         self.dist_day_ax.set_xdata(x)
         self.dist_day_ax.set_ydata(y)
-        self.dist_day_fig.relim()
-        self.dist_day_fig.autoscale_view()
-        plt.draw()
+        self.renderer.update(self.dist_day_fig)
 
     def set_dist_day_mean(self, mean):
         self.dist_day_mean = float(mean)
@@ -205,9 +334,7 @@ class MonteCarloSim(object):
         y = [self.share_types_norm['tent'], self.share_types_norm['car'], self.share_types_norm['caravan']]
         for rect, height in zip(self.share_types_ax, y):
             rect.set_height(height)
-        self.share_types_fig.relim()
-        self.share_types_fig.autoscale_view()
-        plt.draw()
+        self.renderer.update(self.share_types_fig)
 
     def set_share_tent(self, share_tent):
         self.share_types['tent'] = float(share_tent)
@@ -225,9 +352,7 @@ class MonteCarloSim(object):
         y = [self.price_types['tent'], self.price_types['car'], self.price_types['caravan'], self.price_types['person']]
         for rect, height in zip(self.price_types_ax, y):
             rect.set_height(height)
-        self.price_types_fig.relim()
-        self.price_types_fig.autoscale_view()
-        plt.draw()
+        self.renderer.update(self.price_types_fig)
 
     def set_price_tent(self, price_tent):
         self.price_types['tent'] = float(price_tent)
@@ -252,14 +377,19 @@ class MonteCarloSim(object):
         self.costs_daily = float(costs_daily)
 
     def draw_result_groups(self):
-        self.result_groups_ax.set_xdata(np.linspace(0,12, self.days_per_year))
+        x = self.days_x
+        self.result_groups_ax.set_xdata(x)
         self.result_groups_ax.set_ydata(self.result_groups)
+        self.result_groups_median_ax.set_xdata(x)
+        self.result_groups_median_ax.set_ydata(self.result_groups_quantiles[1])
+        if self.result_groups_band is not None:
+            self.result_groups_band.remove()
+        self.result_groups_band = self.result_groups_fig.fill_between(x, self.result_groups_quantiles[0], self.result_groups_quantiles[-1], color='C0', alpha=0.2, linewidth=0)
         self.result_groups_fig.relim()
         self.result_groups_fig.autoscale_view()
-        plt.draw()
 
     def draw_result_balance(self):
-        x = np.linspace(0,12, self.days_per_year)
+        x = self.days_x
 
         self.result_income_ax.set_xdata(x)
         self.result_income_ax.set_ydata(self.result_income)
@@ -275,35 +405,50 @@ class MonteCarloSim(object):
 
         self.result_balance_ax.set_xdata(x)
         self.result_balance_ax.set_ydata(self.result_balance)
+        self.result_balance_median_ax.set_xdata(x)
+        self.result_balance_median_ax.set_ydata(self.result_balance_quantiles[1])
+        if self.result_balance_band is not None:
+            self.result_balance_band.remove()
+        self.result_balance_band = self.result_balance_fig.fill_between(x, self.result_balance_quantiles[0], self.result_balance_quantiles[-1], color=self.result_balance_ax.get_color(), alpha=0.2, linewidth=0, label='Bilanz P5-P95')
+        self.result_balance_fig.legend()
 
         self.result_balance_fig.relim()
         self.result_balance_fig.autoscale_view()
-        plt.draw()
 
     def draw_table_balance(self):
         self.table_balance_ax[1, 0].set_text_props(text=str(round(np.mean(self.result_balance), 2)))
         self.table_balance_ax[2, 0].set_text_props(text=str(round(np.std(self.result_balance), 2)))
         self.table_balance_ax[3, 0].set_text_props(text=str(round(max(self.result_balance), 2)))
         self.table_balance_ax[4, 0].set_text_props(text=str(round(sum(self.result_balance), 2)))
+        self.table_balance_ax[5, 0].set_text_props(text=str(round(self.result_balance_year_quantiles[0], 2)))
+        # month with highest median balance, months without demand only show the fixed costs
+        month = np.argmax(self.result_balance_month_quantiles[1])
+        self.table_balance_ax[6, 0].set_text_props(text=f"{round(self.result_balance_month_quantiles[0, month], 2)} (Monat {month + 1})")
 
         self.table_balance_fig.relim()
         self.table_balance_fig.autoscale_view()
-        plt.draw()
 
     def draw_table_customers(self):
         self.table_customers_ax[1, 0].set_text_props(text=str(round(np.mean(self.result_groups), 2)))
         self.table_customers_ax[2, 0].set_text_props(text=str(round(np.std(self.result_groups), 2)))
         self.table_customers_ax[3, 0].set_text_props(text=str(round(max(self.result_groups), 2)))
+        self.table_customers_ax[4, 0].set_text_props(text=str(round(max(self.result_groups_quantiles[-1]), 2)))
 
         self.table_customers_fig.relim()
         self.table_customers_fig.autoscale_view()
-        plt.draw()
 
     def set_seed(self, seed):
         # numpy requires int as seed, random seed if empty
         self.seed = (None if seed == '' else int(seed))
 
-    def calculate(self, _):
+    def simulate(self):
+        # calculation of all results without drawing them
+        # parameters may have been changed directly without the gui
+        self.dist_nights_norm = norm_list(self.dist_nights)
+        self.dist_people_norm = norm_list(self.dist_people)
+        self.share_types_norm = norm_dict(self.share_types)
+        self.calc_dist_year()
+
         # use seed for reproducibility
         if self.seed is not None:
             self.rng = np.random.default_rng(self.seed)
@@ -315,7 +460,10 @@ class MonteCarloSim(object):
         values_nights = range(1, 1+len(weights_nights))
         weights_people = self.dist_people_norm
         values_people = range(1, 1+len(weights_people))
-        
+
+        # sums per experiment and month, not cached as results
+        self.month_samples = {name: np.zeros((self.N, 12)) for name in MONTH_SAMPLE_NAMES}
+
         progress = 0
 
         # iterate over year
@@ -326,25 +474,19 @@ class MonteCarloSim(object):
             list_num_groups = np.maximum(np.around(self.dist_year[day] * list_num_groups), 0).astype(int)
             self.result_groups[day] = np.mean(list_num_groups)
             
-            # iterate over self.N experiments
-            income_person = []
-            income_type = []
-            costs_customers = []
-            for num_groups in list_num_groups:
-                if num_groups == 0:
-                    income_person.append(0)
-                    income_type.append(0)
-                    costs_customers.append(0)
-                else:
-                    # num_groups groups arrived this day, determine price for type, nights & people for all groups
-                    base_prices = self.rng.choice(values_types, p=weights_types, size=num_groups) # price for type
-                    nights = self.rng.choice(values_nights, p=weights_nights, size=num_groups)
-                    people = self.rng.choice(values_people, p=weights_people, size=num_groups)
-                    # Einnahmen = Grundpreis Typ * Nächte + Preis Person * Personen * Nächte
-                    income_person.append(sum(self.price_types['person'] * people * nights))
-                    income_type.append(sum(base_prices * nights))
-                    # Ausgaben = Kosten pro Person * Personen * Nächte
-                    costs_customers.append(sum(self.costs_customer * people * nights))
+            # all groups of all self.N experiments at once, experiment[i] is the experiment of group i
+            num_groups = list_num_groups.sum()
+            experiment = np.repeat(np.arange(self.N), list_num_groups)
+            # determine price for type, nights & people for all groups
+            base_prices = self.rng.choice(values_types, p=weights_types, size=num_groups) # price for type
+            nights = self.rng.choice(values_nights, p=weights_nights, size=num_groups)
+            people = self.rng.choice(values_people, p=weights_people, size=num_groups)
+            # sum up per experiment
+            # Einnahmen = Grundpreis Typ * Nächte + Preis Person * Personen * Nächte
+            income_person = np.bincount(experiment, weights=self.price_types['person'] * people * nights, minlength=self.N)
+            income_type = np.bincount(experiment, weights=base_prices * nights, minlength=self.N)
+            # Ausgaben = Kosten pro Person * Personen * Nächte
+            costs_customers = np.bincount(experiment, weights=self.costs_customer * people * nights, minlength=self.N)
 
             # store mean values of self.N experiments
             self.result_income_person[day] = np.mean(income_person)
@@ -352,18 +494,211 @@ class MonteCarloSim(object):
             self.result_costs_customers[day] = np.mean(costs_customers)
             self.result_costs_daily[day] = self.costs_daily
 
+            # exact quantiles of results of self.N experiments, all samples of this day are available
+            balance = income_person + income_type + costs_customers + self.costs_daily
+            self.result_groups_quantiles[:, day] = np.quantile(list_num_groups, self.quantiles)
+            self.result_balance_quantiles[:, day] = np.quantile(balance, self.quantiles)
+
+            # add results of every experiment to its month
+            month = 12 * day // self.days_per_year
+            self.month_samples['groups'][:, month] += list_num_groups
+            self.month_samples['people'][:, month] += np.bincount(experiment, weights=people, minlength=self.N)
+            self.month_samples['income_person'][:, month] += income_person
+            self.month_samples['income_type'][:, month] += income_type
+            self.month_samples['costs_customers'][:, month] += costs_customers
+            self.month_samples['balance'][:, month] += balance
+
             # show progress
             percent = round(100 * day / self.days_per_year)
-            if percent - progress >= 10:
+            if self.show_progress and percent - progress >= 10:
                 progress = percent
                 print(f"{progress}%")
 
         self.result_income = self.result_income_person + self.result_income_type
         self.result_balance = self.result_income + self.result_costs_customers + self.result_costs_daily
+        self.result_balance_month_quantiles = np.quantile(self.month_samples['balance'], self.quantiles, axis=0)
+        self.result_balance_year_quantiles = np.quantile(self.month_samples['balance'].sum(axis=1), self.quantiles)
+
+    def get_scenario(self):
+        # current parameters as scenario, see campsite_scenario.py
+        return {
+            'seed': self.seed,
+            'groups': {'day_mean': self.dist_day_mean, 'day_sd': self.dist_day_sd,
+                       'year_mean': self.dist_year_mean, 'year_sd': self.dist_year_sd},
+            'campers': {'form': dict(self.share_types), 'duration': list(self.dist_nights), 'people': list(self.dist_people)},
+            'prices': {'person': self.price_types['person'],
+                       'form': {key: self.price_types[key] for key in ('tent', 'car', 'caravan')}},
+            'costs': {'person': self.costs_customer, 'base': self.costs_daily},
+            'run': {'N': self.N},
+        }
+
+    def set_scenario(self, scenario):
+        # values missing in scenario stay unchanged
+        scenario = merge_scenario(self.get_scenario(), scenario)
+        self.seed = None if scenario['seed'] is None else int(scenario['seed'])
+        self.dist_day_mean = scenario['groups']['day_mean']
+        self.dist_day_sd = scenario['groups']['day_sd']
+        self.dist_year_mean = scenario['groups']['year_mean']
+        self.dist_year_sd = scenario['groups']['year_sd']
+        self.share_types = dict(scenario['campers']['form'])
+        self.dist_nights = list(scenario['campers']['duration'])
+        self.dist_people = list(scenario['campers']['people'])
+        self.price_types = dict(scenario['prices']['form'], person=scenario['prices']['person'])
+        self.costs_customer = scenario['costs']['person']
+        self.costs_daily = scenario['costs']['base']
+        self.N = int(scenario['run']['N'])
+
+    def get_results(self):
+        return {name: getattr(self, 'result_' + name) for name in RESULT_NAMES}
+
+    def set_results(self, results):
+        for name in RESULT_NAMES:
+            setattr(self, 'result_' + name, results[name])
+
+    def simulate_scenario(self, scenario):
+        self.set_scenario(scenario)
+        self.simulate()
+        return self.get_results()
 
+    def calculate(self, _):
+        # identical scenarios are only calculated once if seed is set
+        self.set_results(cached_run(self.cache, 'monte-carlo', self.get_scenario(), self.simulate_scenario))
         self.draw_result_groups()
         self.draw_result_balance()
         self.draw_table_balance()
         self.draw_table_customers()
-
-sim = MonteCarloSim()
+        self.fig.canvas.draw_idle()
+
+# names of result arrays, attributes of MonteCarloSim with prefix 'result_'
+RESULT_NAMES = ('groups', 'income', 'income_person', 'income_type', 'costs_customers', 'costs_daily', 'balance',
+                'groups_quantiles', 'balance_quantiles', 'balance_month_quantiles', 'balance_year_quantiles')
+# names of sums per experiment and month in MonteCarloSim.month_samples
+MONTH_SAMPLE_NAMES = ('groups', 'people', 'income_person', 'income_type', 'costs_customers', 'balance')
+
+
+def thresholds(list_weights):
+    # cumulative relative frequencies without the last one (always 1), category of uniform u is number of thresholds <= u,
+    # distributions with less categories are padded with 1 which is never reached by u < 1
+    cum_weights = [np.cumsum(norm_list(weights))[:-1] for weights in list_weights]
+    padded = np.ones((len(cum_weights), max(len(c) for c in cum_weights)))
+    for row, c in zip(padded, cum_weights):
+        row[:len(c)] = c
+    return padded
+
+
+def prefix_sums(x):
+    # sum of first k values along last axis for k = 0 .. x.shape[-1]
+    return np.concatenate((np.zeros(x.shape[:-1] + (1,), dtype=x.dtype), np.cumsum(x, axis=-1, dtype=x.dtype)), axis=-1)
+
+
+def threshold_sums(u, weights, thresholds, num_groups, chunk=64):
+    """sums of weights of the first num_groups[s, n] groups of experiment n with u >= thresholds[s, j],
+    returns shape (scenarios, thresholds per scenario, N), equal thresholds are only calculated once"""
+    values, index = np.unique(thresholds, return_inverse=True)
+    index = index.reshape(thresholds.shape)
+    experiments = np.arange(u.shape[0])
+    sums = np.zeros(thresholds.shape + (u.shape[0],))
+    for start in range(0, len(values), chunk):
+        # prefix sums over groups for a chunk of thresholds, shape (chunk, N, groups + 1)
+        prefix = prefix_sums((u >= values[start:start + chunk, np.newaxis, np.newaxis]) * weights)
+        s, j = np.nonzero((index >= start) & (index < start + chunk))
+        # flat position of (threshold, experiment, number of groups) in prefix
+        position = ((index[s, j, np.newaxis] - start) * len(experiments) + experiments) * prefix.shape[-1] + num_groups[s]
+        sums[s, j] = prefix.take(position)
+    return sums
+
+
+def simulate_batch(scenarios):
+    """Simulates many scenarios in one vectorized pass, all scenarios use the same random numbers
+    (common random numbers), identical distributions are only evaluated once.
+    Returns results like MonteCarloSim.get_results() with an additional first axis for the scenarios,
+    e.g. shape (scenarios, days) for 'balance'. All scenarios need the same N and seed."""
+    sims = [MonteCarloSim(gui=False, scenario=scenario) for scenario in scenarios]
+    base = sims[0]
+    if any(sim.N != base.N or sim.seed != base.seed for sim in sims):
+        raise ValueError("all scenarios of a batch need the same N and seed")
+    rng = np.random.default_rng(base.seed)
+    N = base.N
+    num_scenarios = len(sims)
+    experiments = np.arange(N)
+
+    # parameters of all scenarios as columns
+    day_mean = np.array([[sim.dist_day_mean] for sim in sims])
+    day_sd = np.array([[sim.dist_day_sd] for sim in sims])
+    dist_year = np.array([normal_dist(base.days_x, sim.dist_year_mean, sim.dist_year_sd, 1) for sim in sims])
+    price_person = np.array([[sim.price_types['person']] for sim in sims])
+    price_types = np.array([[sim.price_types['tent'], sim.price_types['car'], sim.price_types['caravan']] for sim in sims])
+    costs_customer = np.array([[sim.costs_customer] for sim in sims])
+    costs_daily = np.array([sim.costs_daily for sim in sims])
+
+    # price of type = price tent + (price car - price tent) * [u >= t_0] + (price caravan - price car) * [u >= t_1]
+    types_thresholds = thresholds([[sim.share_types['tent'], sim.share_types['car'], sim.share_types['caravan']] for sim in sims])
+    types_steps = np.diff(price_types, axis=1)
+    # people = 1 + sum of [u >= t_j]
+    people_thresholds = thresholds([sim.dist_people for sim in sims])
+    # nights are needed as values, scenarios with same distribution of nights are simulated together
+    nights_scenarios = {}
+    for s, sim in enumerate(sims):
+        nights_scenarios.setdefault(tuple(norm_list(sim.dist_nights)), []).append(s)
+
+    results = {name: np.zeros((num_scenarios, base.days_per_year)) for name in RESULT_NAMES}
+    results['groups_quantiles'] = np.zeros((num_scenarios, len(base.quantiles), base.days_per_year))
+    results['balance_quantiles'] = np.zeros((num_scenarios, len(base.quantiles), base.days_per_year))
+    # balance per scenario, experiment and month
+    balance_months = np.zeros((num_scenarios, N, 12))
+
+    for day in range(base.days_per_year):
+        # number of groups of all scenarios and experiments from the same standard normal random numbers
+        z = rng.standard_normal(N)
+        num_groups = np.maximum(np.around(dist_year[:, day, np.newaxis] * (day_mean + day_sd * z)), 0).astype(int)
+
+        # type, nights & people of group g in experiment n from the same uniform random numbers for all scenarios,
+        # only the first num_groups groups of an experiment arrived
+        u = rng.random((3, N, num_groups.max()))
+
+        # nights, nights per type and person nights summed over the arrived groups of every experiment
+        nights_sum = np.zeros((num_scenarios, N))
+        type_nights = np.zeros((num_scenarios, 2, N))
+        person_nights = np.zeros((num_scenarios, N))
+        for dist_nights, members in nights_scenarios.items():
+            cum = np.cumsum(dist_nights)
+            nights = np.minimum(np.searchsorted(cum, u[1], side='right'), len(cum) - 1).astype(np.int32) + 1
+            nights_sum[members] = prefix_sums(nights)[experiments, num_groups[members]]
+            type_nights[members] = threshold_sums(u[0], nights, types_thresholds[members], num_groups[members])
+            person_nights[members] = nights_sum[members] + threshold_sums(u[2], nights, people_thresholds[members], num_groups[members]).sum(axis=1)
+
+        # Einnahmen = Grundpreis Typ * Nächte + Preis Person * Personen * Nächte
+        income_person = price_person * person_nights
+        income_type = price_types[:, :1] * nights_sum + np.einsum('sj,sjn->sn', types_steps, type_nights)
+        # Ausgaben = Kosten pro Person * Personen * Nächte
+        costs_customers = costs_customer * person_nights
+        balance = income_person + income_type + costs_customers + costs_daily[:, np.newaxis]
+
+        # mean and quantiles of N experiments, all samples of this day are available
+        results['groups'][:, day] = num_groups.mean(axis=1)
+        results['income_person'][:, day] = income_person.mean(axis=1)
+        results['income_type'][:, day] = income_type.mean(axis=1)
+        results['costs_customers'][:, day] = costs_customers.mean(axis=1)
+        results['costs_daily'][:, day] = costs_daily
+        results['groups_quantiles'][:, :, day] = np.quantile(num_groups, base.quantiles, axis=1).T
+        results['balance_quantiles'][:, :, day] = np.quantile(balance, base.quantiles, axis=1).T
+        balance_months[:, :, 12 * day // base.days_per_year] += balance
+
+    results['income'] = results['income_person'] + results['income_type']
+    results['balance'] = results['income'] + results['costs_customers'] + results['costs_daily']
+    results['balance_month_quantiles'] = np.quantile(balance_months, base.quantiles, axis=1).transpose(1, 0, 2)
+    results['balance_year_quantiles'] = np.quantile(balance_months.sum(axis=2), base.quantiles, axis=1).T
+    return results
+
+
+def default_scenario():
+    return MonteCarloSim(gui=False).get_scenario()
+
+
+def simulate_scenario(scenario):
+    return MonteCarloSim(gui=False).simulate_scenario(scenario)
+
+
+if __name__ == '__main__':
+    # optional scenario file (TOML or JSON) as first argument
+    sim = MonteCarloSim(scenario=load_scenario(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -0,0 +1,253 @@
+import copy
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import matplotlib.pyplot as plt
+from campsite_scenario import ENGINE_FILES, ResultCache, cached_run, load_script, resolve_scenario, run, scenario_hash, set_parameter
+from campsite_metrics import Metrics, start_exporters, timed
+
+
+def halton(n, dims, skip=1, rng=None):
+    # quasi-random low discrepancy sequence in [0, 1)^dims via radical inverse to the first prime bases,
+    # scrambled if rng is given: random permutation of digits per dimension and digit position,
+    # otherwise bases >= n would just give i / base and columns of large bases would be almost identical
+    primes = []
+    candidate = 2
+    while len(primes) < dims:
+        if all(candidate % p != 0 for p in primes):
+            primes.append(candidate)
+        candidate += 1
+
+    points = np.zeros((n, dims))
+    for dim, base in enumerate(primes):
+        index = np.arange(skip, skip + n)
+        # number of digits of largest index
+        digits = 1
+        while base**digits <= skip + n - 1:
+            digits += 1
+        fraction = 1.0
+        for _ in range(digits):
+            fraction /= base
+            digit = index % base
+            points[:, dim] += fraction * (digit if rng is None else rng.permutation(base)[digit])
+            index //= base
+        if rng is not None:
+            # random position inside the smallest interval instead of its lower bound
+            points[:, dim] += fraction * rng.random(n)
+    return points
+
+
+def saltelli_design(bounds, n, seed=None):
+    """creates the matrices A, B (n x d) and AB (d x n x d) of the Saltelli scheme,
+    AB[i] equals A except column i which is taken from B"""
+    rng = np.random.default_rng(seed)
+    lower, upper = np.array(bounds, dtype=float).T
+    dims = len(bounds)
+
+    # scrambled sequence, columns of A and B are independent and designs differ for different seeds
+    points = halton(n, 2 * dims, rng=rng)
+    A = lower + points[:, :dims] * (upper - lower)
+    B = lower + points[:, dims:] * (upper - lower)
+
+    AB = np.repeat(A[np.newaxis], dims, axis=0)
+    for i in range(dims):
+        AB[i, :, i] = B[:, i]
+    return A, B, AB
+
+
+def sobol_indices(f_A, f_B, f_AB, num_bootstrap=200, confidence=0.95, seed=None):
+    """first-order (Saltelli 2010) and total-order (Jansen) indices from one set of evaluations,
+    confidence intervals via bootstrap of the same evaluations"""
+    rng = np.random.default_rng(seed)
+    n = len(f_A)
+
+    def estimate(index):
+        a = f_A[index]
+        b = f_B[index]
+        ab = f_AB[:, index]
+        var = np.var(np.concatenate((a, b)))
+        first = np.mean(b * (ab - a), axis=1) / var
+        total = 0.5 * np.mean((a - ab)**2, axis=1) / var
+        return first, total
+
+    first, total = estimate(np.arange(n))
+    samples = [estimate(rng.integers(0, n, n)) for _ in range(num_bootstrap)]
+    first_samples = np.array([s[0] for s in samples])
+    total_samples = np.array([s[1] for s in samples])
+
+    alpha = (1 - confidence) / 2
+    return {
+        'S1': first,
+        'S1_conf': np.quantile(first_samples, [alpha, 1 - alpha], axis=0),
+        'ST': total,
+        'ST_conf': np.quantile(total_samples, [alpha, 1 - alpha], axis=0),
+    }
+
+
+################################################################################
+################################### Engines ####################################
+################################################################################
+
+def balance_monte_carlo(batch):
+    # annual balance of all scenarios of the batch simulated together in one vectorized pass
+    return {'balance': load_script(ENGINE_FILES['monte-carlo']).simulate_batch(batch['scenarios'])['balance'].sum(axis=1)}
+
+
+def evaluate_batch(engine, names, rows, scenario, integers, cache_directory):
+    # annual balance for every parameter set in rows, each parameter set overwrites values of scenario
+    cache = None if cache_directory is None else ResultCache(cache_directory)
+    variants = []
+    for row in rows:
+        variant = copy.deepcopy(scenario)
+        for name, value in zip(names, row):
+            set_parameter(variant, name, int(round(value)) if name in integers else float(value))
+        variants.append(variant)
+    # same seed for all parameter sets (common random numbers) reduces noise of the indices
+    if engine == 'monte-carlo':
+        # random numbers of simulate_batch differ from single runs, so the batch is cached as a whole
+        batch = {'seed': scenario.get('seed'), 'scenarios': [resolve_scenario(engine, variant) for variant in variants]}
+        return list(cached_run(cache, engine, batch, balance_monte_carlo)['balance'])
+    return [np.sum(run(engine, variant, cache)['balance']) for variant in variants]
+
+
+def evaluate(engine, names, design, scenario, integers=(), workers=1, batch_size=16, cache_directory=None, metrics=None):
+    """evaluates all rows of design in batches, in parallel if workers > 1,
+    finished batches are counted in metrics if given (parameter sets as experiments, days are not counted)"""
+    batches = [design[i:i + batch_size] for i in range(0, len(design), batch_size)]
+    args = (scenario, integers, cache_directory)
+    if metrics is None:
+        metrics = Metrics(engine, scenario.get('seed'), None, len(design), len(batches))
+    if workers == 1:
+        results = []
+        for batch in batches:
+            worker, seconds, result = timed(evaluate_batch, engine, names, batch, *args)
+            metrics.finish_chunk(worker, seconds, len(batch), 0)
+            results.append(result)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [metrics.track(executor.submit(timed, evaluate_batch, engine, names, batch, *args), len(batch), 0)
+                       for batch in batches]
+            results = [future.result()[2] for future in futures]
+    return np.concatenate(results)
+
+
+def analyze(settings):
+    """Sobol sensitivity analysis of the annual balance for the given settings"""
+    parameters = {name: bounds for name, bounds in settings.parameters.items()
+                  if settings.engine == 'simulation' or name not in settings.simulation_only}
+    names = list(parameters)
+    dims = len(names)
+    A, B, AB = saltelli_design(list(parameters.values()), settings.n, settings.seed)
+
+    # evaluate all design points at once, every evaluation is used for first-order and total-order indices
+    design = np.concatenate((A, B, AB.reshape(-1, dims)))
+    scenario = dict(settings.scenarios[settings.engine], seed=settings.seed)
+    metrics = Metrics(settings.engine, settings.seed, scenario_hash(settings.engine, resolve_scenario(settings.engine, scenario)),
+                      len(design), -(-len(design) // settings.batch_size))
+    exporters = start_exporters(metrics, settings.metrics_port, settings.metrics_file, settings.metrics_interval)
+    try:
+        results = evaluate(settings.engine, names, design, scenario, settings.integers, settings.workers, settings.batch_size,
+                           settings.cache_directory, metrics)
+    finally:
+        for exporter in exporters:
+            exporter.stop()
+    f_A = results[:settings.n]
+    f_B = results[settings.n:2 * settings.n]
+    f_AB = results[2 * settings.n:].reshape(dims, settings.n)
+
+    indices = sobol_indices(f_A, f_B, f_AB, settings.num_bootstrap, settings.confidence, settings.seed)
+    indices['names'] = names
+    indices['evaluations'] = len(design)
+    return indices
+
+
+def print_indices(indices):
+    print(f"{'Parameter':<22}{'S1':>8}{'S1 KI':>20}{'ST':>8}{'ST KI':>20}")
+    for i, name in enumerate(indices['names']):
+        s1_conf = f"[{indices['S1_conf'][0][i]:.3f}, {indices['S1_conf'][1][i]:.3f}]"
+        st_conf = f"[{indices['ST_conf'][0][i]:.3f}, {indices['ST_conf'][1][i]:.3f}]"
+        print(f"{name:<22}{indices['S1'][i]:>8.3f}{s1_conf:>20}{indices['ST'][i]:>8.3f}{st_conf:>20}")
+
+
+def plot_indices(indices, title):
+    plt.figure(figsize=(10,6))
+    plt.suptitle(title, weight='bold')
+    x = np.arange(len(indices['names']))
+    for offset, key, label in ((-0.2, 'S1', 'erste Ordnung'), (0.2, 'ST', 'totale Ordnung')):
+        error = np.abs(indices[key + '_conf'] - indices[key])
+        plt.bar(x + offset, indices[key], width=0.4, yerr=error, capsize=3, label=label)
+    plt.xticks(x, indices['names'], rotation=45, ha='right')
+    plt.ylabel('Sobol-Index Gesamtbilanz')
+    plt.legend()
+    plt.tight_layout()
+
+
+################################################################################
+################################### Settings ###################################
+################################################################################
+
+class SensitivitySettings(object):
+    # engine to analyze: 'monte-carlo' or 'simulation'
+    engine = 'monte-carlo'
+
+    # lower and upper bound of uniform distributed parameters, names are paths in scenario (see campsite_scenario.py)
+    parameters = {
+        'groups.day_mean': (10, 16),
+        'groups.day_sd': (2, 5),
+        'groups.year_mean': (6.5, 8.5),
+        'groups.year_sd': (1.0, 2.5),
+        'campers.form.tent': (0.5, 2),
+        'campers.form.car': (1.5, 4.5),
+        'campers.form.caravan': (3, 9),
+        'prices.form.tent': (3, 8),
+        'prices.form.car': (6, 12),
+        'prices.form.caravan': (10, 20),
+        'prices.person': (3, 8),
+        'sizes.limit_people': (100, 200),
+        'sizes.num_lots': (20, 40),
+    }
+    # capacity limits only exist in the discrete simulation
+    simulation_only = ('sizes.limit_people', 'sizes.num_lots')
+    # parameters rounded to integer numbers
+    integers = ('sizes.limit_people', 'sizes.num_lots')
+
+    # number of base samples, total number of evaluations is n * (number of parameters + 2)
+    n = 64
+    # seed for design, bootstrap and simulations (common random numbers)
+    seed = 42
+    # number of bootstrap resamples and confidence level of intervals
+    num_bootstrap = 200
+    confidence = 0.95
+
+    # number of parallel processes, None uses all cpus
+    workers = None
+    # number of parameter sets evaluated per task, simulated together in one vectorized pass by the Monte Carlo engine
+    batch_size = 16
+    # optional live progress and busy time per worker process in Prometheus text format,
+    # served on http://127.0.0.1:metrics_port/metrics and/or written to metrics_file every metrics_interval seconds
+    metrics_port = None
+    metrics_file = None
+    metrics_interval = 10
+
+    # scenario per engine all parameter sets are based on, reduced precision per evaluation compared to single runs
+    scenarios = {
+        'monte-carlo': {'run': {'N': 200}},
+        'simulation': {'run': {'num_experiments': 5}},
+    }
+    # results of already evaluated parameter sets are reused, None disables the cache
+    cache_directory = Path(__file__).with_name('.cache')
+
+################################################################################
+################################################################################
+################################################################################
+
+if __name__ == '__main__':
+
+    for engine in ('monte-carlo', 'simulation'):
+        SensitivitySettings.engine = engine
+        indices = analyze(SensitivitySettings)
+        print(f"{engine}: {indices['evaluations']} evaluations")
+        print_indices(indices)
+        plot_indices(indices, f"Sensitivitätsanalyse Gesamtbilanz ({engine})")
+
+    plt.show()
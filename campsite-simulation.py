@@ -1,8 +1,16 @@
+import os
+import sys
+import gzip
+import json
 import random
 from math import exp, sqrt, pi
 from enum import Enum
+from functools import lru_cache
+import time
 import simpy
 import matplotlib.pyplot as plt
+from campsite_metrics import Metrics, start_exporters
+from campsite_scenario import ResultCache, load_scenario, merge_scenario, run, scenario_hash
 
 
 def normal_dist(x , mean , sd, scale=None):
@@ -26,6 +34,39 @@ def print_msg(time, *args, **kwargs):
     print(f"{time:.1f}:", *args, **kwargs)
 
 
+# maximum number of points per plotted series, longer series are decimated
+PLOT_MAX_POINTS = 2000
+
+
+@lru_cache(maxsize=None)
+def month_axis(num_days):
+    # x values in months for day-wise series, computed once for all series of same length
+    return tuple(12 * x / num_days for x in range(num_days))
+
+
+def decimate(x, y, max_points):
+    # keep minimum and maximum of every bucket of days, extremes stay visible with fewer points
+    size = -(-2 * len(y) // max_points)
+    x_decimated = []
+    y_decimated = []
+    for start in range(0, len(y), size):
+        bucket = y[start:start + size]
+        low = min(range(len(bucket)), key=bucket.__getitem__)
+        high = max(range(len(bucket)), key=bucket.__getitem__)
+        for i in sorted({low, high}):
+            x_decimated.append(x[start + i])
+            y_decimated.append(bucket[i])
+    return x_decimated, y_decimated
+
+
+def plot_days(values, max_points=PLOT_MAX_POINTS, **kwargs):
+    """plots day-wise values over months as markers"""
+    x = month_axis(len(values))
+    if len(values) > max_points:
+        x, values = decimate(x, values, max_points)
+    return plt.plot(x, values, linestyle='', marker='.', **kwargs)
+
+
 def plot_parameter(settings):
     plt.figure(figsize=(8,8))
     plt.suptitle('Parameter Simulation Campingplatz', weight='bold')
@@ -66,50 +107,41 @@ def plot_usage(statistics):
     plt.suptitle('Auslastung Campingplatz', weight='bold')
 
     fig = plt.subplot(321, title='Anzahl Gäste', xlabel='Monat')
-    count_x = [12 * x / len(statistics.people.count) for x in range(len(statistics.people.count))]
-    plt.plot(count_x, statistics.people.count, linestyle='', marker='.')
+    plot_days(statistics.people.count)
     if statistics.people.limit != simpy.core.Infinity:
         plt.axhline(statistics.people.limit, color='red', linestyle='--', label='Limit')
         plt.legend()
     fig.set_xticks(list(range(1,13)))
 
     fig = plt.subplot(322, title='neue Gäste', xlabel='Monat')
-    new_x = [12 * x / len(statistics.people.new) for x in range(len(statistics.people.new))]
-    plt.plot(new_x, statistics.people.new, linestyle='', marker='.', label='gesamt')
-    reject_x = [12 * x / len(statistics.people.reject) for x in range(len(statistics.people.reject))]
-    plt.plot(reject_x, statistics.people.reject, linestyle='', marker='.', label='abgelehnt')
+    plot_days(statistics.people.new, label='gesamt')
+    plot_days(statistics.people.reject, label='abgelehnt')
     fig.set_xticks(list(range(1,13)))
     plt.legend()
 
     fig = plt.subplot(323, title='genutze Plätze Zeltwiese', xlabel='Monat')
-    count_x = [12 * x / len(statistics.tent_meadow.count) for x in range(len(statistics.tent_meadow.count))]
-    plt.plot(count_x, statistics.tent_meadow.count, linestyle='', marker='.')
+    plot_days(statistics.tent_meadow.count)
     if statistics.tent_meadow.limit != simpy.core.Infinity:
         plt.axhline(statistics.tent_meadow.limit, color='red', linestyle='--', label='Limit')
         plt.legend()
     fig.set_xticks(list(range(1,13)))
 
     fig = plt.subplot(324, title='neue Gruppen Zeltwiese', xlabel='Monat')
-    new_x = [12 * x / len(statistics.tent_meadow.new) for x in range(len(statistics.tent_meadow.new))]
-    plt.plot(new_x, statistics.tent_meadow.new, linestyle='', marker='.', label='gesamt')
-    reject_x = [12 * x / len(statistics.tent_meadow.reject) for x in range(len(statistics.tent_meadow.reject))]
-    plt.plot(reject_x, statistics.tent_meadow.reject, linestyle='', marker='.', label='abgelehnt')
+    plot_days(statistics.tent_meadow.new, label='gesamt')
+    plot_days(statistics.tent_meadow.reject, label='abgelehnt')
     fig.set_xticks(list(range(1,13)))
     plt.legend()
 
     fig = plt.subplot(325, title='genutze Parzellen Caravan', xlabel='Monat')
-    count_x = [12 * x / len(statistics.caravan_lots.count) for x in range(len(statistics.caravan_lots.count))]
-    plt.plot(count_x, statistics.caravan_lots.count, linestyle='', marker='.')
+    plot_days(statistics.caravan_lots.count)
     if statistics.caravan_lots.limit != simpy.core.Infinity:
         plt.axhline(statistics.caravan_lots.limit, color='red', linestyle='--', label='Limit')
         plt.legend()
     fig.set_xticks(list(range(1,13)))
 
     fig = plt.subplot(326, title='neue Gruppen Caravan', xlabel='Monat')
-    new_x = [12 * x / len(statistics.caravan_lots.new) for x in range(len(statistics.caravan_lots.new))]
-    plt.plot(new_x, statistics.caravan_lots.new, linestyle='', marker='.', label='gesamt')
-    reject_x = [12 * x / len(statistics.caravan_lots.reject) for x in range(len(statistics.caravan_lots.reject))]
-    plt.plot(reject_x, statistics.caravan_lots.reject, linestyle='', marker='.', label='abgelehnt')
+    plot_days(statistics.caravan_lots.new, label='gesamt')
+    plot_days(statistics.caravan_lots.reject, label='abgelehnt')
     fig.set_xticks(list(range(1,13)))
 
     plt.tight_layout()
@@ -122,22 +154,27 @@ def plot_financial(statistics):
     title = f"Finanzen Campingplatz, Gesamtbilanz = {balance_total}, Schnitt Bilanz pro Tag = {balance_mean}"
     plt.suptitle(title, weight='bold')
 
-    earnings_person_x = [12 * x / len(statistics.earnings_person) for x in range(len(statistics.earnings_person))]
-    plt.plot(earnings_person_x, statistics.earnings_person, linestyle='', marker='.', label='Einnahmen Personen')
-    earnings_base_x = [12 * x / len(statistics.earnings_base) for x in range(len(statistics.earnings_base))]
-    plt.plot(earnings_base_x, statistics.earnings_base, linestyle='', marker='.', label='Einnahmen Grundpreis')
-    costs_person_x = [12 * x / len(statistics.costs_person) for x in range(len(statistics.costs_person))]
-    plt.plot(costs_person_x, statistics.costs_person, linestyle='', marker='.', label='Selbstkosten')
-    costs_base_x = [12 * x / len(statistics.costs_base) for x in range(len(statistics.costs_base))]
-    plt.plot(costs_base_x, statistics.costs_base, linestyle='', marker='.', label='Gemeinkosten')
-    balance_x = [12 * x / len(statistics.balance) for x in range(len(statistics.balance))]
-    fig = plt.plot(balance_x, statistics.balance, linestyle='', marker='.', label='Bilanz')
+    plot_days(statistics.earnings_person, label='Einnahmen Personen')
+    plot_days(statistics.earnings_base, label='Einnahmen Grundpreis')
+    plot_days(statistics.costs_person, label='Selbstkosten')
+    plot_days(statistics.costs_base, label='Gemeinkosten')
+    fig = plot_days(statistics.balance, label='Bilanz')
     #fig.set_xticks(list(range(1,13)))
     plt.legend()
 
     plt.tight_layout()
 
 
+def plot_scenarios(list_statistics, labels, max_points=PLOT_MAX_POINTS):
+    """compares balance of several scenarios, e.g. results of fork(), max_points is shared by all scenarios"""
+    plt.figure(figsize=(10,6))
+    plt.suptitle('Bilanz pro Tag nach Szenario', weight='bold')
+    for statistics, label in zip(list_statistics, labels):
+        plot_days(statistics.balance, max(2, max_points // len(list_statistics)), label=label)
+    plt.legend()
+    plt.tight_layout()
+
+
 class Usage():
     """"""
     def __init__(self, limit):
@@ -158,6 +195,8 @@ class Statistics():
         self.caravan_lots = Usage(limit_caravan_lots)
         self.people = Usage(limit_people)
 
+        self.groups = [] # number of arriving camper groups (checked in or rejected), day-wise
+
         self.earnings_person = [] # earnings depending on number people, day-wise
         self.earnings_base = [] # earnings by base price depending on camper form, day-wise
 
@@ -171,6 +210,8 @@ class Statistics():
         self.caravan_lots.add_empty_day()
         self.people.add_empty_day()
 
+        self.groups.append(0)
+
         self.earnings_person.append(0)
         self.earnings_base.append(0)
 
@@ -206,6 +247,33 @@ class Statistics():
     def calc_balance(self):
         self.balance = [sum(x) for x in zip(self.earnings_person, self.earnings_base, self.costs_person, self.costs_base)]
 
+    def as_dict(self):
+        """all day-wise lists, usages with prefix of their name e.g. 'people.count'"""
+        d = {}
+        for name in USAGE_NAMES:
+            usage = getattr(self, name)
+            d[name + '.count'] = usage.count
+            d[name + '.new'] = usage.new
+            d[name + '.reject'] = usage.reject
+        d['groups'] = self.groups
+        for name in FINANCIAL_NAMES:
+            d[name] = getattr(self, name)
+        return d
+
+    @staticmethod
+    def from_dict(d, limit_tent_meadow, limit_caravan_lots, limit_people):
+        """inverse of as_dict"""
+        statistics = Statistics(limit_tent_meadow, limit_caravan_lots, limit_people)
+        for name in USAGE_NAMES:
+            usage = getattr(statistics, name)
+            usage.count = list(d[name + '.count'])
+            usage.new = list(d[name + '.new'])
+            usage.reject = list(d[name + '.reject'])
+        statistics.groups = list(d['groups'])
+        for name in FINANCIAL_NAMES:
+            setattr(statistics, name, list(d[name]))
+        return statistics
+
     @staticmethod
     def average_list(list_statistics, averaged):
         """averages all properties of list of Statistics objects into single Statistics object"""
@@ -221,6 +289,8 @@ class Statistics():
         averaged.people.new = [sum(x) / len(x) for x in zip(*[stat.people.new for stat in list_statistics])]
         averaged.people.reject = [sum(x) / len(x) for x in zip(*[stat.people.reject for stat in list_statistics])]
         
+        averaged.groups = [sum(x) / len(x) for x in zip(*[stat.groups for stat in list_statistics])]
+
         averaged.earnings_person = [sum(x) / len(x) for x in zip(*[stat.earnings_person for stat in list_statistics])]
         averaged.earnings_base = [sum(x) / len(x) for x in zip(*[stat.earnings_base for stat in list_statistics])]
         
@@ -228,6 +298,11 @@ class Statistics():
         averaged.costs_base = [sum(x) / len(x) for x in zip(*[stat.costs_base for stat in list_statistics])]
 
 
+# names of usages and financial lists of Statistics
+USAGE_NAMES = ('tent_meadow', 'caravan_lots', 'people')
+FINANCIAL_NAMES = ('earnings_person', 'earnings_base', 'costs_person', 'costs_base', 'balance')
+
+
 class Camperform(Enum):
     # just a tent, only allowed on tent meadow (needs 1 place)
     TENT = 0
@@ -237,30 +312,44 @@ class Camperform(Enum):
     CARAVAN = 2
 
 
+class Occupancy(simpy.Container):
+    """Container whose initial level may exceed its capacity, e.g. a snapshot continued with a lower limit:
+    groups on the campsite stay, new groups are rejected until the level dropped below the capacity."""
+    def __init__(self, env, capacity, init=0):
+        super().__init__(env, capacity, min(init, capacity))
+        self._level = init
+
+
 class Campsite(object):
-    def __init__(self, env, prices, costs, sizes):
+    def __init__(self, env, prices, costs, sizes, levels=None):
         # simulation environment
         self.env = env
+
+        # occupancy at start, empty campsite if None
+        levels = {'tent_meadow': 0, 'caravan_lots': 0, 'people': 0} if levels is None else levels
         
         # meadow where campers with tent will stay
-        self.tent_meadow = simpy.Container(self.env, init=0, capacity=sizes.size_meadow)
+        self.tent_meadow = Occupancy(self.env, init=levels['tent_meadow'], capacity=sizes.size_meadow)
         # lots where campers with caravan will stay
-        self.caravan_lots = simpy.Container(self.env, init=0, capacity=sizes.num_lots)
+        self.caravan_lots = Occupancy(self.env, init=levels['caravan_lots'], capacity=sizes.num_lots)
 
         # limited number of people due to corona regulations (unlimited is possible with capacity=simpy.core.Infinity)
-        self.people = simpy.Container(self.env, init=0, capacity=sizes.limit_people)
+        self.people = Occupancy(self.env, init=levels['people'], capacity=sizes.limit_people)
 
         # daily prices and costs
         self.prices = prices
         self.costs = costs
 
+        # groups currently staying on campsite: name -> (form, number of people, time of check out)
+        self.stays = {}
+
+    def levels(self):
+        return {'tent_meadow': self.tent_meadow.level, 'caravan_lots': self.caravan_lots.level, 'people': self.people.level}
 
-def setup(env, settings, statistics):
-    """Creates a campsite. Creates new arriving groups on every new day
-    and let them try to check in to the campsite."""
-    # create new empty campsite
-    campsite = Campsite(env, settings.prices, settings.costs, settings.sizes)
 
+def setup(env, settings, statistics, campsite, rng):
+    """Creates new arriving groups on every new day
+    and let them try to check in to the campsite."""
     print_msg(env.now, "start simulation")
 
     # new groups arrive every day
@@ -271,18 +360,19 @@ def setup(env, settings, statistics):
         statistics.add_empty_day()
 
         # choose random number of new groups for this day, independent of day in year
-        num_groups = random.normalvariate(settings.groups.day_mean, settings.groups.day_sd)
+        num_groups = rng.normalvariate(settings.groups.day_mean, settings.groups.day_sd)
         # apply multiplicator specific to day in year, round to integer numbers, clip to minimum value 0
         num_groups = max(round(settings.groups.year[day] * num_groups), 0)
+        statistics.groups[-1] += num_groups
 
         # choose random form for every group
-        forms = random.choices(settings.campers.form_val, cum_weights=settings.campers.form_wght, k=num_groups)
+        forms = rng.choices(settings.campers.form_val, cum_weights=settings.campers.form_wght, k=num_groups)
 
         # choose random duration of stay for every group
-        durations = random.choices(settings.campers.duration_val, cum_weights=settings.campers.duration_wght, k=num_groups)
+        durations = rng.choices(settings.campers.duration_val, cum_weights=settings.campers.duration_wght, k=num_groups)
 
         # choose random number of people for every group
-        num_people = random.choices(settings.campers.people_val, cum_weights=settings.campers.people_wght, k=num_groups)
+        num_people = rng.choices(settings.campers.people_val, cum_weights=settings.campers.people_wght, k=num_groups)
 
         for i in range(num_groups):
             # create new arriving campers, they try to check in on camp site
@@ -341,6 +431,8 @@ def camper(env, name, campsite, form, num_people, duration, statistics):
             print_msg(env.now, name, f"reject {form}, no place available")
             # add rejection to statistics
             statistics.add_usage(form, reject=num_people)
+            # check people out
+            yield campsite.people.get(num_people)
         else:
             print_msg(env.now, name, f"check in {form}, {num_people} people, {duration} nights")
 
@@ -355,20 +447,28 @@ def camper(env, name, campsite, form, num_people, duration, statistics):
 
             # occupy place on campsite during the duration of stay
             # check out before 11:30, check in after 14:00 => remove 2.5 hours (0.1 days) time difference from duration
-            yield env.timeout(duration - 0.1)
+            yield from stay(env, name, campsite, form, num_people, env.now + duration - 0.1)
 
-            # leave place on campsite after stay
-            if form is Camperform.TENT:
-                yield campsite.tent_meadow.get(1)
-            elif  form is Camperform.TENT_CAR:
-                yield campsite.tent_meadow.get(2)
-            elif form is Camperform.CARAVAN:
-                yield campsite.caravan_lots.get(1)
 
-            print_msg(env.now, name, "check out")
+def stay(env, name, campsite, form, num_people, check_out):
+    """Group occupies its place on the campsite until time check_out, then leaves.
+    Also used to continue stays of checked in groups when resuming from a snapshot."""
+    campsite.stays[name] = (form, num_people, check_out)
+    yield env.timeout(check_out - env.now)
 
-        # check people out
-        yield campsite.people.get(num_people)
+    # leave place on campsite after stay
+    if form is Camperform.TENT:
+        yield campsite.tent_meadow.get(1)
+    elif  form is Camperform.TENT_CAR:
+        yield campsite.tent_meadow.get(2)
+    elif form is Camperform.CARAVAN:
+        yield campsite.caravan_lots.get(1)
+
+    print_msg(env.now, name, "check out")
+    del campsite.stays[name]
+
+    # check people out
+    yield campsite.people.get(num_people)
 
 
 ################################################################################
@@ -435,45 +535,252 @@ class Settings(object):
     seed = 42
     # number of repetitions of simulation, results are averaged over all experiments
     num_experiments = 25
+    # file to save state of running experiments to every checkpoint_days days, an interrupted run resumes from it
+    checkpoint = None
+    checkpoint_days = 30
+    # optional live metrics of running experiments in Prometheus text format,
+    # served on http://127.0.0.1:metrics_port/metrics and/or written to metrics_file every metrics_interval seconds
+    metrics_port = None
+    metrics_file = None
+    metrics_interval = 10
 
 ################################################################################
 ################################################################################
 ################################################################################
 
-if __name__ == '__main__':
-
+def prepare_settings(settings):
+    """derives the values needed by the simulation from the given settings"""
     # calculate multiplicator for each day of year (360 days = 12 month * 30 days per month)
-    Settings.groups.year = [normal_dist(day / 30, Settings.groups.year_mean, Settings.groups.year_sd, 1) for day in range(12 * 30)]
+    settings.groups.year = [normal_dist(day / 30, settings.groups.year_mean, settings.groups.year_sd, 1) for day in range(12 * 30)]
 
     # calculate cumulative weights from absolute frequencies
-    Settings.campers.form_val, Settings.campers.form_wght = accumulate_dict(Settings.campers.form)
-    Settings.campers.duration_val, Settings.campers.duration_wght = accumulate_dict(Settings.campers.duration)
-    Settings.campers.people_val, Settings.campers.people_wght = accumulate_dict(Settings.campers.people)
+    settings.campers.form_val, settings.campers.form_wght = accumulate_dict(settings.campers.form)
+    settings.campers.duration_val, settings.campers.duration_wght = accumulate_dict(settings.campers.duration)
+    settings.campers.people_val, settings.campers.people_wght = accumulate_dict(settings.campers.people)
+
+
+class Snapshot(object):
+    """State of one experiment at the begin of a day: occupancy of campsite, checked in groups,
+    state of random number generator and statistics of all days before.
+    Saved as gzip compressed JSON."""
+    def __init__(self, day, rng_state, levels, stays, statistics):
+        self.day = day # first day not simulated yet
+        self.rng_state = rng_state
+        self.levels = levels # occupancy of tent meadow, caravan lots and people
+        self.stays = stays # list of (name, form, number of people, time of check out)
+        self.statistics = statistics # Statistics.as_dict()
+
+    def as_dict(self):
+        version, internal_state, gauss_next = self.rng_state
+        return {
+            'day': self.day,
+            'rng_state': [version, list(internal_state), gauss_next],
+            'levels': self.levels,
+            'stays': [[name, form.name, num_people, check_out] for name, form, num_people, check_out in self.stays],
+            'statistics': {key: list(value) for key, value in self.statistics.items()},
+        }
+
+    @staticmethod
+    def from_dict(d):
+        version, internal_state, gauss_next = d['rng_state']
+        stays = [(name, Camperform[form], num_people, check_out) for name, form, num_people, check_out in d['stays']]
+        return Snapshot(d['day'], (version, tuple(internal_state), gauss_next), d['levels'], stays, d['statistics'])
+
+
+def save_json(path, d):
+    # write to temporary file first, an interruption while saving keeps the previous file intact
+    tmp = f"{path}.tmp"
+    with gzip.open(tmp, 'wt') as f:
+        json.dump(d, f, separators=(',', ':'))
+    os.replace(tmp, path)
+
 
-    random.seed(Settings.seed)
+def load_json(path):
+    with gzip.open(path, 'rt') as f:
+        return json.load(f)
 
-    statistics = [] # list of statistics with one entry per experiment
 
-    for _ in range(Settings.num_experiments):
-        statistic = Statistics(Settings.sizes.size_meadow, Settings.sizes.num_lots, Settings.sizes.limit_people)
+def start_experiment(settings, experiment):
+    """snapshot of experiment at day 0 with empty campsite"""
+    # every experiment has its own random number generator, experiments can be continued independently
+    rng = random.Random(None if settings.seed is None else f"{settings.seed}-{experiment}")
+    statistic = Statistics(settings.sizes.size_meadow, settings.sizes.num_lots, settings.sizes.limit_people)
+    return Snapshot(0, rng.getstate(), None, [], statistic.as_dict())
 
-        env = simpy.Environment()
-        startup = env.process(setup(env, Settings, statistic))
 
-        env.run(until=360) # simulate one year with 360 days (12 month * 30 days per month)
+def continue_experiment(settings, snapshot, until=360, metrics=None):
+    """simulates days from snapshot.day until day until (exclusive) and returns snapshot at day until,
+    settings may differ from settings used for snapshot (what-if scenarios)"""
+    rng = random.Random()
+    rng.setstate(snapshot.rng_state)
+    statistic = Statistics.from_dict(snapshot.statistics, settings.sizes.size_meadow, settings.sizes.num_lots, settings.sizes.limit_people)
+    if metrics is not None:
+        # metrics read the statistics while they are filled
+        metrics.start_part(statistic)
 
-        # add statistics to overall statistics
-        statistics.append(statistic)
+    env = simpy.Environment(initial_time=snapshot.day)
+    campsite = Campsite(env, settings.prices, settings.costs, settings.sizes, snapshot.levels)
+    # checked in groups continue their stay
+    for name, form, num_people, check_out in snapshot.stays:
+        env.process(stay(env, name, campsite, form, num_people, check_out))
+    env.process(setup(env, settings, statistic, campsite, rng))
 
-    # calculate mean of results over all experiments
-    statistic_mean = Statistics(Settings.sizes.size_meadow, Settings.sizes.num_lots, Settings.sizes.limit_people)
-    Statistics.average_list(statistics, statistic_mean)
+    # stop before next day starts, groups check out at 0.9 of a day
+    env.run(until=until - 0.05)
+
+    stays = [(name, form, num_people, check_out) for name, (form, num_people, check_out) in campsite.stays.items()]
+    return Snapshot(until, rng.getstate(), campsite.levels(), stays, statistic.as_dict())
+
+
+def add_statistics(total, statistics):
+    # day-wise sum of statistics of experiments (both as_dict()), total is None for first experiment
+    if total is None:
+        return {key: list(value) for key, value in statistics.items()}
+    return {key: [a + b for a, b in zip(total[key], statistics[key])] for key in total}
+
+
+def average_statistics(settings, total, count):
+    # calculate mean of results over all experiments from their sum
+    mean = {key: [x / count for x in value] for key, value in total.items()}
+    statistic_mean = Statistics.from_dict(mean, settings.sizes.size_meadow, settings.sizes.num_lots, settings.sizes.limit_people)
 
     # calculate financial balance
     statistic_mean.calc_balance()
 
+    return statistic_mean
+
+
+def run_experiments(settings):
+    """runs settings.num_experiments simulations of one year and returns the averaged statistics,
+    state is saved to settings.checkpoint every settings.checkpoint_days days if set and resumed from there,
+    live metrics are exported if settings.metrics_port or settings.metrics_file is set"""
+    prepare_settings(settings)
+
+    # checkpoint is only valid for same scenario and same code
+    key = scenario_hash('simulation', scenario_from_settings(settings))
+    metrics = Metrics('simulation', settings.seed, key, settings.num_experiments)
+    completed = 0 # number of finished experiments
+    total = None # sum of statistics of finished experiments
+    current = None # snapshot of running experiment
+    if settings.checkpoint is not None and os.path.exists(settings.checkpoint):
+        checkpoint = load_json(settings.checkpoint)
+        if checkpoint['key'] == key:
+            completed = checkpoint['completed']
+            total = checkpoint['total']
+            current = None if checkpoint['current'] is None else Snapshot.from_dict(checkpoint['current'])
+            metrics.restore(checkpoint['metrics'])
+
+    exporters = start_exporters(metrics, settings.metrics_port, settings.metrics_file, settings.metrics_interval)
+
+    try:
+        for experiment in range(completed, settings.num_experiments):
+            snapshot = start_experiment(settings, experiment) if current is None else current
+            current = None
+            metrics.experiment = experiment
+            while snapshot.day < 360: # simulate one year with 360 days (12 month * 30 days per month)
+                step = 360 if settings.checkpoint is None else settings.checkpoint_days
+                start = time.monotonic()
+                day = snapshot.day
+                snapshot = continue_experiment(settings, snapshot, min(360, snapshot.day + step), metrics)
+                metrics.finish_part(snapshot.day - day, time.monotonic() - start)
+                if snapshot.day == 360:
+                    completed += 1
+                    total = add_statistics(total, snapshot.statistics)
+                    metrics.finish_experiment(snapshot.statistics)
+                if settings.checkpoint is not None:
+                    save_json(settings.checkpoint, {'key': key, 'completed': completed, 'total': total, 'metrics': metrics.state(),
+                                                    'current': None if snapshot.day == 360 else snapshot.as_dict()})
+    finally:
+        for exporter in exporters:
+            exporter.stop()
+
+    if settings.checkpoint is not None:
+        os.remove(settings.checkpoint)
+
+    return average_statistics(settings, total, completed)
+
+
+def warm_up(settings, day):
+    """snapshots of all experiments at begin of day, shared start of several what-if scenarios"""
+    prepare_settings(settings)
+    return [continue_experiment(settings, start_experiment(settings, experiment), day) for experiment in range(settings.num_experiments)]
+
+
+def fork(settings, snapshots, until=360):
+    """continues snapshots of warm_up() with (changed) settings and returns the averaged statistics,
+    with lower capacities than the occupancy of a snapshot all groups stay and new groups are rejected until it fits"""
+    prepare_settings(settings)
+    total = None
+    for snapshot in snapshots:
+        total = add_statistics(total, continue_experiment(settings, snapshot, until).statistics)
+    return average_statistics(settings, total, len(snapshots))
+
+
+# names of camper forms in scenarios
+FORM_NAMES = {Camperform.TENT: 'tent', Camperform.TENT_CAR: 'car', Camperform.CARAVAN: 'caravan'}
+
+
+def scenario_from_settings(settings):
+    """settings as scenario, see campsite_scenario.py"""
+    return {
+        'seed': settings.seed,
+        'groups': {'day_mean': settings.groups.day_mean, 'day_sd': settings.groups.day_sd,
+                   'year_mean': settings.groups.year_mean, 'year_sd': settings.groups.year_sd},
+        'campers': {'form': {FORM_NAMES[form]: weight for form, weight in settings.campers.form.items()},
+                    # absolute frequencies for 1 to n nights / people
+                    'duration': [settings.campers.duration[n] for n in sorted(settings.campers.duration)],
+                    'people': [settings.campers.people[n] for n in sorted(settings.campers.people)]},
+        'prices': {'person': settings.prices.person,
+                   'form': {FORM_NAMES[form]: price for form, price in settings.prices.form.items()}},
+        'costs': {'person': settings.costs.person, 'base': settings.costs.base},
+        'sizes': {'size_meadow': settings.sizes.size_meadow, 'num_lots': settings.sizes.num_lots,
+                  'limit_people': settings.sizes.limit_people},
+        'run': {'num_experiments': settings.num_experiments},
+    }
+
+
+def settings_from_scenario(scenario, base=Settings):
+    """new settings classes derived from base with values of scenario, base stays untouched"""
+    scenario = merge_scenario(scenario_from_settings(base), scenario)
+    forms = {name: form for form, name in FORM_NAMES.items()}
+    groups = type('DistGroups', (base.groups,), dict(scenario['groups']))
+    campers = type('DistCampers', (base.campers,), {
+        'form': {forms[name]: weight for name, weight in scenario['campers']['form'].items()},
+        'duration': {n + 1: weight for n, weight in enumerate(scenario['campers']['duration'])},
+        'people': {n + 1: weight for n, weight in enumerate(scenario['campers']['people'])},
+    })
+    prices = type('Prices', (base.prices,), {
+        'person': scenario['prices']['person'],
+        'form': {forms[name]: price for name, price in scenario['prices']['form'].items()},
+    })
+    costs = type('Costs', (base.costs,), dict(scenario['costs']))
+    sizes = type('Sizes', (base.sizes,), dict(scenario['sizes']))
+    return type('Settings', (base,), {
+        'groups': groups, 'campers': campers, 'prices': prices, 'costs': costs, 'sizes': sizes,
+        'seed': scenario['seed'], 'num_experiments': int(scenario['run']['num_experiments']),
+    })
+
+
+def default_scenario():
+    return scenario_from_settings(Settings)
+
+
+def simulate_scenario(scenario):
+    return run_experiments(settings_from_scenario(scenario)).as_dict()
+
+
+if __name__ == '__main__':
+
+    # optional scenario file (TOML or JSON) as first argument
+    settings = Settings if len(sys.argv) < 2 else settings_from_scenario(load_scenario(sys.argv[1]))
+    prepare_settings(settings)
+
+    # identical scenarios are only calculated once, results are loaded from cache afterwards
+    results = run('simulation', scenario_from_settings(settings), ResultCache())
+    statistic_mean = Statistics.from_dict(results, settings.sizes.size_meadow, settings.sizes.num_lots, settings.sizes.limit_people)
+
     # show everything in pretty format
-    plot_parameter(Settings)
+    plot_parameter(settings)
     plot_usage(statistic_mean)
     plot_financial(statistic_mean)
     plt.show()
@@ -0,0 +1,239 @@
+import sys
+from math import exp, lgamma, log, sqrt
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from campsite_scenario import ENGINE_FILES, load_scenario, load_script, merge_scenario, resolve_scenario, scenario_hash
+from campsite_metrics import Metrics, start_exporters, timed
+
+
+################################################################################
+################################## Statistics ##################################
+################################################################################
+
+def betainc(a, b, x):
+    # regularized incomplete beta function I_x(a, b) via continued fraction (Lentz), see Numerical Recipes
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+    if x > (a + 1) / (a + b + 2):
+        # continued fraction converges fast only for small x
+        return 1 - betainc(b, a, 1 - x)
+    front = exp(lgamma(a + b) - lgamma(a) - lgamma(b) + a * log(x) + b * log(1 - x))
+    tiny = 1e-300
+    c = 1.0
+    d = 1 / max(abs(1 - (a + b) * x / (a + 1)), tiny)
+    f = d
+    for m in range(1, 500):
+        for numerator in (m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+                          -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))):
+            d = 1 + numerator * d
+            d = 1 / (d if abs(d) > tiny else tiny)
+            c = 1 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            f *= c * d
+        if abs(c * d - 1) < 1e-12:
+            break
+    return front * f / a
+
+
+def welch_test(a, b):
+    """Welch's t-test for equal means of two samples, returns t and two-sided p-value"""
+    var_a = np.var(a, ddof=1) / len(a)
+    var_b = np.var(b, ddof=1) / len(b)
+    if var_a + var_b == 0:
+        # constant samples, e.g. fixed costs
+        return 0.0, 1.0 if np.mean(a) == np.mean(b) else 0.0
+    t = (np.mean(a) - np.mean(b)) / sqrt(var_a + var_b)
+    df = (var_a + var_b)**2 / (var_a**2 / (len(a) - 1) + var_b**2 / (len(b) - 1))
+    return t, betainc(df / 2, 0.5, df / (df + t * t))
+
+
+def ks_test(a, b):
+    """two-sample Kolmogorov-Smirnov test, returns maximum distance D of the empirical distribution functions
+    and asymptotic p-value (conservative for discrete values)"""
+    a = np.sort(a)
+    b = np.sort(b)
+    x = np.concatenate((a, b))
+    d = np.max(np.abs(np.searchsorted(a, x, side='right') / len(a) - np.searchsorted(b, x, side='right') / len(b)))
+    n = len(a) * len(b) / (len(a) + len(b))
+    lam = (sqrt(n) + 0.12 + 0.11 / sqrt(n)) * d
+    if lam < 0.2:
+        # series converges slowly, p-value is 1 anyway
+        return d, 1.0
+    p = 2 * sum((-1)**(k - 1) * exp(-2 * k * k * lam * lam) for k in range(1, 101))
+    return d, min(max(p, 0.0), 1.0)
+
+
+TESTS = {'welch': welch_test, 'ks': ks_test}
+
+
+def holm(p_values, alpha):
+    """rejected null hypotheses of the Holm-Bonferroni procedure, family-wise error rate alpha over all p-values"""
+    reject = np.zeros(len(p_values), dtype=bool)
+    for rank, i in enumerate(np.argsort(p_values)):
+        if p_values[i] > alpha / (len(p_values) - rank):
+            break
+        reject[i] = True
+    return reject
+
+
+################################################################################
+################################### Engines ####################################
+################################################################################
+
+def samples_monte_carlo(scenario, first, count):
+    # sums per month of experiments first .. first + count - 1 of the Monte Carlo simulation
+    mc = load_script(ENGINE_FILES['monte-carlo'])
+    sim = mc.MonteCarloSim(gui=False, scenario=scenario)
+    sim.N = count
+    # own random numbers for every chunk of experiments
+    sim.seed = None if sim.seed is None else [sim.seed, first]
+    sim.simulate()
+    return sim.month_samples
+
+
+def samples_simulation(scenario, first, count):
+    # sums per month of experiments first .. first + count - 1 of the discrete simulation
+    sim = load_script(ENGINE_FILES['simulation'])
+    settings = sim.settings_from_scenario(scenario)
+    sim.prepare_settings(settings)
+    samples = {name: np.zeros((count, 12)) for name in ('groups', 'people', 'income_person', 'income_type', 'balance')}
+    for i in range(count):
+        statistics = sim.continue_experiment(settings, sim.start_experiment(settings, first + i)).statistics
+        months = {key: np.reshape(statistics[key], (12, 30)).sum(axis=1)
+                  for key in ('groups', 'people.new', 'earnings_person', 'earnings_base', 'costs_base')}
+        samples['groups'][i] = months['groups']
+        samples['people'][i] = months['people.new']
+        samples['income_person'][i] = months['earnings_person']
+        samples['income_type'][i] = months['earnings_base']
+        # costs per person are charged for every night on the campsite here, but booked for the whole stay
+        # at check in by the Monte Carlo simulation like the earnings: book them at check in for the balance as well,
+        # not compared on their own as they are proportional to income_person then
+        costs_person = months['earnings_person'] * settings.costs.person / settings.prices.person
+        samples['balance'][i] = samples['income_person'][i] + samples['income_type'][i] + costs_person + months['costs_base']
+    return samples
+
+
+# sample functions of engines: (resolved scenario, first experiment, number of experiments) -> dict of arrays
+# with sums per experiment and month, shape (experiments, 12); add alternative (faster) engines here
+ENGINES = {'simulation': samples_simulation, 'monte-carlo': samples_monte_carlo}
+
+
+def collect(executor, metrics, engine, scenario, replications, chunk_size):
+    # submits experiments of engine in chunks, returns function collecting the results
+    futures = []
+    for first in range(0, replications, chunk_size):
+        count = min(chunk_size, replications - first)
+        # one year has 360 days in both engines
+        futures.append(metrics.track(executor.submit(timed, ENGINES[engine], scenario, first, count), count, 360 * count))
+    def result():
+        chunks = [future.result()[2] for future in futures]
+        return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+    return result
+
+
+def compare(reference, candidate, tests, alpha):
+    """two-sample tests per metric and month for all metrics provided by both engines,
+    returns list of (metric, month, test, statistic, p-value, drift)"""
+    metrics = [name for name in reference if name in candidate]
+    rows = []
+    for name in metrics:
+        for month in range(12):
+            for test in tests:
+                statistic, p = TESTS[test](reference[name][:, month], candidate[name][:, month])
+                rows.append((name, month, test, statistic, p))
+    drift = holm(np.array([row[4] for row in rows]), alpha)
+    return [row + (bool(d),) for row, d in zip(rows, drift)]
+
+
+def validate(settings, scenario=None):
+    """runs reference and candidate engines in parallel on one shared scenario and compares their
+    monthly results, returns dict candidate -> {'results': compare(...), 'passed': bool}"""
+    shared = resolve_scenario(settings.reference, settings.scenario)
+    if scenario is not None:
+        shared = merge_scenario(shared, scenario)
+
+    engines = (settings.reference,) + tuple(settings.candidates)
+    # progress of all engines together, annual results are not mixed and therefore not reported
+    metrics = Metrics('+'.join(engines), shared['seed'], scenario_hash(settings.reference, shared),
+                      sum(settings.replications[engine] for engine in engines),
+                      sum(-(-settings.replications[engine] // settings.chunk_size[engine]) for engine in engines))
+    exporters = start_exporters(metrics, settings.metrics_port, settings.metrics_file, settings.metrics_interval)
+    try:
+        with ProcessPoolExecutor(max_workers=settings.workers) as executor:
+            # all chunks of all engines are submitted before waiting for any of them
+            pending = {engine: collect(executor, metrics, engine, shared, settings.replications[engine], settings.chunk_size[engine])
+                       for engine in engines}
+            samples = {engine: result() for engine, result in pending.items()}
+    finally:
+        for exporter in exporters:
+            exporter.stop()
+
+    report = {}
+    for candidate in settings.candidates:
+        results = compare(samples[settings.reference], samples[candidate], settings.tests, settings.alpha)
+        report[candidate] = {'results': results, 'passed': not any(row[5] for row in results)}
+    return report
+
+
+def print_report(report, reference):
+    for candidate, result in report.items():
+        print(f"{candidate} vs. {reference}: {'passed' if result['passed'] else 'DRIFT'}")
+        # smallest p-value of all tests per metric and month, * marks a drift
+        p_min = {}
+        for name, month, test, statistic, p, drift in result['results']:
+            old = p_min.get((name, month), (1.0, False))
+            p_min[(name, month)] = (min(old[0], p), old[1] or drift)
+        print(f"{'Metrik':<16}" + ''.join(f"{month + 1:>8}" for month in range(12)))
+        for name in dict.fromkeys(row[0] for row in result['results']):
+            print(f"{name:<16}" + ''.join(f"{p:>7.3f}{'*' if drift else ' '}"
+                                          for p, drift in (p_min[(name, month)] for month in range(12))))
+        for name, month, test, statistic, p, drift in result['results']:
+            if drift:
+                print(f"  {name} month {month + 1}: {test} statistic {statistic:.3f}, p = {p:.2g}")
+
+
+################################################################################
+################################### Settings ###################################
+################################################################################
+
+class ValidationSettings(object):
+    # engine all other engines are checked against
+    reference = 'simulation'
+    candidates = ('monte-carlo',)
+
+    # scenario shared by all engines, missing values are taken from the defaults of the reference engine;
+    # capacity limits only exist in the discrete simulation, they must not be reached to compare engines
+    scenario = {'seed': 42, 'sizes': {'size_meadow': 10**6, 'num_lots': 10**6, 'limit_people': 10**6}}
+
+    # number of simulated years per engine and number of years per parallel task
+    replications = {'simulation': 400, 'monte-carlo': 4000}
+    chunk_size = {'simulation': 25, 'monte-carlo': 1000}
+
+    # two-sample tests per metric and month: 'welch' (equal means) and 'ks' (equal distributions)
+    tests = ('welch', 'ks')
+    # family-wise error rate over all tests of a candidate (Holm-Bonferroni), smaller p-values are reported as drift
+    alpha = 0.01
+
+    # number of parallel processes, None uses all cpus
+    workers = None
+
+    # optional live progress and busy time per worker process in Prometheus text format,
+    # served on http://127.0.0.1:metrics_port/metrics and/or written to metrics_file every metrics_interval seconds
+    metrics_port = None
+    metrics_file = None
+    metrics_interval = 10
+
+################################################################################
+################################################################################
+################################################################################
+
+if __name__ == '__main__':
+
+    # optional scenario file (TOML or JSON) as first argument
+    report = validate(ValidationSettings, load_scenario(sys.argv[1]) if len(sys.argv) > 1 else None)
+    print_report(report, ValidationSettings.reference)
+
+    # exit code 1 if any engine drifts, e.g. for automatic checks after performance work on an engine
+    sys.exit(0 if all(result['passed'] for result in report.values()) else 1)
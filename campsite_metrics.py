@@ -0,0 +1,223 @@
+import os
+import time
+import threading
+from math import sqrt
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class RunningStat(namedtuple('RunningStat', ('n', 'mean', 'm2'), defaults=(0, 0.0, 0.0))):
+    """Running mean and variance (Welford). Immutable, add() returns a new object,
+    so readers in other threads always see consistent values without locking."""
+    def add(self, x):
+        n = self.n + 1
+        delta = x - self.mean
+        mean = self.mean + delta / n
+        return RunningStat(n, mean, self.m2 + delta * (x - mean))
+
+    @property
+    def sd(self):
+        return sqrt(self.m2 / (self.n - 1)) if self.n > 1 else float('nan')
+
+    @property
+    def ci_width(self):
+        # width of 95% confidence interval of mean (normal approximation)
+        return 2 * 1.96 * self.sd / sqrt(self.n) if self.n > 1 else float('nan')
+
+
+def timed(function, *args):
+    """calls function(*args) and returns (process id, seconds, result),
+    submitted to process pools so that the driver can account busy time per worker process"""
+    start = time.monotonic()
+    result = function(*args)
+    return os.getpid(), time.monotonic() - start, result
+
+
+class Metrics(object):
+    """Progress of a batch of experiments. Only the simulation or the driver of a process pool writes,
+    exporters only read; every update is a single attribute assignment, the simulation is never blocked."""
+    def __init__(self, engine, seed, scenario, num_experiments, num_chunks=None):
+        self.engine = engine
+        self.seed = seed
+        self.scenario = scenario # scenario hash
+        self.num_experiments = num_experiments
+        self.num_chunks = num_chunks # number of tasks of a process pool, None if experiments run in this process
+        self.start = time.monotonic()
+
+        self.experiment = None # number of running experiment
+        # (Statistics of running experiment, number of days in it at start), statistics are filled day by day by the simulation
+        self.current = None
+        self.completed = 0 # number of finished experiments
+        self.days_completed = 0 # days simulated in finished parts of experiments
+        self.chunks_completed = 0 # number of finished tasks of a process pool
+        self.busy = {} # seconds spent simulating per process id, replaced on every update
+
+        # annual results of finished experiments
+        self.balance = RunningStat()
+        self.rejections = {'people': RunningStat(), 'tent_meadow': RunningStat(), 'caravan_lots': RunningStat()}
+
+    def start_part(self, statistics):
+        # called before simulating days of an experiment, statistics may contain days of a snapshot
+        self.current = (statistics, len(statistics.earnings_person))
+
+    def finish_part(self, days, seconds):
+        # called after simulating days of an experiment, before the next part starts
+        self.current = None
+        self.days_completed += days
+        self.add_busy(os.getpid(), seconds)
+
+    def add_busy(self, worker, seconds):
+        self.busy = {**self.busy, worker: self.busy.get(worker, 0.0) + seconds}
+
+    def finish_chunk(self, worker, seconds, experiments, days):
+        # called for a finished task of a process pool with the process id and busy time returned by timed()
+        self.add_busy(worker, seconds)
+        self.days_completed += days
+        self.completed += experiments
+        self.chunks_completed += 1
+
+    def track(self, future, experiments, days):
+        """counts future of executor.submit(timed, ...) when it finishes, returns future"""
+        def done(future):
+            # runs in a thread of the executor, the only writer while the pool is running
+            if not future.cancelled() and future.exception() is None:
+                worker, seconds, _ = future.result()
+                self.finish_chunk(worker, seconds, experiments, days)
+        future.add_done_callback(done)
+        return future
+
+    def finish_experiment(self, statistics):
+        """adds annual results of a finished experiment, statistics as Statistics.as_dict()"""
+        balance = sum(map(sum, zip(statistics['earnings_person'], statistics['earnings_base'],
+                                   statistics['costs_person'], statistics['costs_base'])))
+        self.balance = self.balance.add(balance)
+        self.rejections = {name: stat.add(sum(statistics[name + '.reject'])) for name, stat in self.rejections.items()}
+        self.completed += 1
+
+    def state(self):
+        # results of finished experiments, saved with checkpoints
+        return {'completed': self.completed, 'balance': list(self.balance),
+                'rejections': {name: list(stat) for name, stat in self.rejections.items()}}
+
+    def restore(self, state):
+        self.completed = state['completed']
+        self.balance = RunningStat(*state['balance'])
+        self.rejections = {name: RunningStat(*stat) for name, stat in state['rejections'].items()}
+
+    def days_simulated(self):
+        # days simulated by this process, days loaded from checkpoints are not counted
+        current = self.current # local reference, may be replaced by the simulation meanwhile
+        if current is None:
+            return self.days_completed
+        statistics, start = current
+        # one entry per started day in statistics, running day is not finished
+        return self.days_completed + max(0, len(statistics.earnings_person) - start - 1)
+
+    def prometheus(self):
+        """all metrics in Prometheus text exposition format"""
+        elapsed = time.monotonic() - self.start
+        days = self.days_simulated()
+        balance = self.balance
+        rejections = self.rejections
+        busy = self.busy
+        lines = []
+
+        def metric(name, kind, text, samples):
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                labels = ','.join(f'{key}="{value}"' for key, value in labels.items())
+                lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+
+        metric('campsite_run_info', 'gauge', 'Engine, seed and scenario hash of the running batch',
+               [({'engine': self.engine, 'seed': self.seed, 'scenario': self.scenario}, 1)])
+        metric('campsite_replications_planned', 'gauge', 'Number of experiments of the batch', [({}, self.num_experiments)])
+        metric('campsite_replications_completed_total', 'counter', 'Number of finished experiments', [({}, self.completed)])
+        metric('campsite_replication_current', 'gauge', 'Number of running experiment, its random number stream is seed-experiment',
+               [({}, -1 if self.experiment is None else self.experiment)])
+        metric('campsite_simulated_days_total', 'counter', 'Simulated days over all experiments', [({}, days)])
+        metric('campsite_simulated_days_per_second', 'gauge', 'Simulated days per second of wall time', [({}, days / elapsed if elapsed > 0 else 0)])
+        if self.num_chunks is not None:
+            metric('campsite_chunks_planned', 'gauge', 'Number of tasks submitted to the process pool', [({}, self.num_chunks)])
+            metric('campsite_chunks_completed_total', 'counter', 'Number of finished tasks of the process pool', [({}, self.chunks_completed)])
+        metric('campsite_worker_busy_seconds_total', 'counter', 'Seconds spent simulating per worker process',
+               [({'worker': worker}, seconds) for worker, seconds in busy.items()])
+        metric('campsite_worker_utilization', 'gauge', 'Share of wall time spent simulating per worker process',
+               [({'worker': worker}, seconds / elapsed if elapsed > 0 else 0) for worker, seconds in busy.items()])
+        metric('campsite_balance_mean', 'gauge', 'Running mean of annual balance', [({}, balance.mean)])
+        metric('campsite_balance_ci_width', 'gauge', 'Width of 95% confidence interval of mean annual balance', [({}, balance.ci_width)])
+        metric('campsite_rejections_mean', 'gauge', 'Running mean of annual rejections',
+               [({'usage': name}, stat.mean) for name, stat in rejections.items()])
+        metric('campsite_rejections_ci_width', 'gauge', 'Width of 95% confidence interval of mean annual rejections',
+               [({'usage': name}, stat.ci_width) for name, stat in rejections.items()])
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer(object):
+    """serves metrics in Prometheus text format on http://host:port/metrics in a background thread"""
+    def __init__(self, metrics, port=9100, host='127.0.0.1'):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path not in ('/', '/metrics'):
+                    handler.send_error(404)
+                    return
+                body = metrics.prometheus().encode()
+                handler.send_response(200)
+                handler.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, *args):
+                pass # no output per request
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsFileWriter(object):
+    """writes metrics in Prometheus text format to path every interval seconds in a background thread"""
+    def __init__(self, metrics, path, interval=10):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def write(self):
+        # write to temporary file first, readers never see partial files
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(self.metrics.prometheus())
+        os.replace(tmp, self.path)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.write() # final state
+
+
+def start_exporters(metrics, port=None, path=None, interval=10):
+    """serves metrics on port and/or writes them to path if given, returns the started exporters to stop() them"""
+    exporters = []
+    if port is not None:
+        exporters.append(MetricsServer(metrics, port).start())
+    if path is not None:
+        exporters.append(MetricsFileWriter(metrics, path, interval).start())
+    return exporters
@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import copy
+import hashlib
+import tomllib
+import importlib.util
+from pathlib import Path
+from functools import lru_cache
+import numpy as np
+
+
+# scripts of the engines, a scenario can be simulated by each of them
+ENGINE_FILES = {'monte-carlo': 'campsite-monte-carlo.py', 'simulation': 'campsite-simulation.py'}
+
+
+def load_script(filename):
+    # the simulation scripts can't be imported directly because of the '-' in their names
+    name = Path(filename).stem.replace('-', '_')
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, Path(__file__).with_name(filename))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
+
+
+def load_scenario(path):
+    """reads a scenario from a TOML or JSON file, values not given keep the defaults of the engine,
+    raises ValueError for keys no engine knows"""
+    path = Path(path)
+    if path.suffix == '.json':
+        with open(path) as f:
+            scenario = json.load(f)
+    else:
+        with open(path, 'rb') as f:
+            scenario = tomllib.load(f)
+    check_scenario(scenario, path)
+    return scenario
+
+
+def union_scenario(a, b):
+    # all keys of both scenarios, values of a are kept
+    union = dict(b)
+    for key, value in a.items():
+        union[key] = union_scenario(value, b[key]) if isinstance(value, dict) and isinstance(b.get(key), dict) else value
+    return union
+
+
+@lru_cache(maxsize=None)
+def known_scenario():
+    # keys of all engines, one scenario may contain values of each of them
+    known = {}
+    for filename in ENGINE_FILES.values():
+        known = union_scenario(known, load_script(filename).default_scenario())
+    return known
+
+
+def unknown_keys(scenario, known, prefix=''):
+    # dotted paths of keys in scenario which are not in known
+    keys = []
+    for key, value in scenario.items():
+        path = f"{prefix}{key}"
+        if key not in known or isinstance(value, dict) != isinstance(known[key], dict):
+            keys.append(path)
+        elif isinstance(value, dict):
+            keys += unknown_keys(value, known[key], path + '.')
+    return keys
+
+
+def check_scenario(scenario, source='scenario'):
+    """raises ValueError for keys no engine knows, e.g. typos like [group] or day_maen, which would otherwise
+    silently run the defaults; keys of other engines (e.g. sizes or run.N) are allowed and dropped by merge_scenario"""
+    keys = unknown_keys(scenario, known_scenario())
+    if keys:
+        raise ValueError(f"unknown keys in {source}: {', '.join(keys)}")
+
+
+def merge_scenario(defaults, scenario):
+    # values of scenario replace defaults, keys unknown to the engine are dropped (see check_scenario)
+    merged = {}
+    for key, value in defaults.items():
+        if key not in scenario:
+            merged[key] = copy.deepcopy(value)
+        elif isinstance(value, dict):
+            merged[key] = merge_scenario(value, scenario[key])
+        else:
+            merged[key] = copy.deepcopy(scenario[key])
+    return merged
+
+
+def set_parameter(scenario, path, value):
+    # set value addressed by dotted path, e.g. 'prices.form.tent'
+    *parents, key = path.split('.')
+    for parent in parents:
+        scenario = scenario.setdefault(parent, {})
+    scenario[key] = value
+
+
+def resolve_scenario(engine, scenario):
+    """full parameter set of engine: engine defaults overwritten by values of scenario,
+    raises ValueError for keys no engine knows"""
+    check_scenario(scenario)
+    return merge_scenario(load_script(ENGINE_FILES[engine]).default_scenario(), scenario)
+
+
+def canonical(value):
+    # numbers as float so that 12 and 12.0 result in the same scenario
+    if isinstance(value, dict):
+        return {str(key): canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [canonical(item) for item in value]
+    if isinstance(value, (bool, str)) or value is None:
+        return value
+    return float(value)
+
+
+@lru_cache(maxsize=None)
+def code_version(engine):
+    # results are only valid for the exact code of the engine which produced them
+    return hashlib.sha256(Path(__file__).with_name(ENGINE_FILES[engine]).read_bytes()).hexdigest()
+
+
+def scenario_hash(engine, scenario):
+    """deterministic key of a resolved scenario including seed, engine and code version"""
+    key = json.dumps({'engine': engine, 'code': code_version(engine), 'scenario': canonical(scenario)},
+                     sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class ResultCache(object):
+    """Results of scenarios on disk as compressed numpy arrays, one file per scenario hash.
+    Least recently used files are removed if the cache exceeds max_bytes."""
+    def __init__(self, directory=Path(__file__).with_name('.cache'), max_bytes=500 * 2**20):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path(self, key):
+        return self.directory / f"{key}.npz"
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                results = {name: data[name] for name in data.files}
+        except (OSError, ValueError):
+            return None
+        # modification time marks last usage for eviction
+        os.utime(path)
+        return results
+
+    def put(self, key, results):
+        # write to temporary file first, concurrent readers never see partial files
+        path = self.path(key)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(f, **{name: np.asarray(value) for name, value in results.items()})
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self):
+        files = []
+        for path in self.directory.glob('*.npz'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue # removed by another process
+            files.append((stat.st_mtime, stat.st_size, path))
+        size = sum(f[1] for f in files)
+        for _, file_size, path in sorted(files):
+            if size <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            size -= file_size
+
+
+def cached_run(cache, engine, scenario, compute):
+    """returns results of the resolved scenario from cache or calculates and stores them via compute(scenario)"""
+    # without seed results are random and not reproducible
+    if cache is None or scenario.get('seed') is None:
+        return compute(scenario)
+    key = scenario_hash(engine, scenario)
+    results = cache.get(key)
+    if results is None:
+        results = compute(scenario)
+        cache.put(key, results)
+    return results
+
+
+def run(engine, scenario, cache=None):
+    """results of scenario simulated by engine as dict of numpy arrays"""
+    scenario = resolve_scenario(engine, scenario)
+    return cached_run(cache, engine, scenario, load_script(ENGINE_FILES[engine]).simulate_scenario)
+
+
+def sweep(engine, scenarios, cache=None):
+    """results for a list of scenarios, only scenarios missing in cache are calculated"""
+    return [run(engine, scenario, cache) for scenario in scenarios]